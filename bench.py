@@ -0,0 +1,230 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Базовый URL API
+BASE_URL = "http://localhost:8021"
+
+TEST_QUESTION = "Какие требования к газоопасным работам?"
+RUNS = 5
+
+# Локальный mock LLM сервера для бенчмарка конкурентности
+MOCK_LLM_PORT = 8099
+MOCK_LLM_DELAY = 0.5
+CONCURRENCY = 20
+
+
+def print_separator(title):
+    print(f"\n{'='*60}")
+    print(f" {title}")
+    print(f"{'='*60}")
+
+
+def print_latencies(name, values_ms):
+    if not values_ms:
+        print(f"   {name}: нет данных")
+        return
+    print(
+        f"   {name}: медиана {statistics.median(values_ms):.0f} мс, "
+        f"мин {min(values_ms):.0f} мс, макс {max(values_ms):.0f} мс"
+    )
+
+
+def measure_full_answer(question):
+    """Время полного ответа /get_answer (то, сколько пользователь видит спиннер)"""
+    started = time.perf_counter()
+    response = requests.post(f"{BASE_URL}/get_answer", json={"question": question})
+    response.raise_for_status()
+    return (time.perf_counter() - started) * 1000
+
+
+def measure_stream_answer(question):
+    """TTFT и общее время потокового ответа /get_answer_stream"""
+    started = time.perf_counter()
+    first_token_ms = None
+
+    with requests.post(
+        f"{BASE_URL}/get_answer_stream",
+        json={"question": question},
+        stream=True
+    ) as response:
+        response.raise_for_status()
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                if event is None and first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - started) * 1000
+                if event == "error":
+                    raise RuntimeError(json.loads(line[5:]).get("detail"))
+            elif not line:
+                event = None
+
+    total_ms = (time.perf_counter() - started) * 1000
+    return first_token_ms if first_token_ms is not None else total_ms, total_ms
+
+
+def bench_ttft(question=TEST_QUESTION, runs=RUNS):
+    """Сравнение TTFT потокового ответа с задержкой полного ответа"""
+    print_separator("БЕНЧМАРК: TTFT /get_answer_stream против /get_answer")
+    print(f"Вопрос: {question}, прогонов: {runs}")
+
+    full, ttft, stream_total = [], [], []
+    for i in range(runs):
+        try:
+            full.append(measure_full_answer(question))
+            first, total = measure_stream_answer(question)
+            ttft.append(first)
+            stream_total.append(total)
+        except Exception as e:
+            print(f"❌ Прогон {i + 1}: {e}")
+
+    print_latencies("/get_answer, полный ответ", full)
+    print_latencies("/get_answer_stream, первый токен", ttft)
+    print_latencies("/get_answer_stream, полный ответ", stream_total)
+    if full and ttft:
+        print(f"   Первый токен раньше полного ответа в {statistics.median(full) / statistics.median(ttft):.1f} раз")
+
+
+def start_mock_llm(delay=MOCK_LLM_DELAY, port=MOCK_LLM_PORT):
+    """Поднимает в фоновом потоке mock LLM: POST /chat отвечает через delay секунд"""
+
+    class MockLLMHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего бэкенда
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            time.sleep(delay)
+
+            body = json.dumps(
+                {"response": f"Ответ на: {payload.get('prompt', '')[:40]}"},
+                ensure_ascii=False
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockLLMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_llm_concurrency(concurrency=CONCURRENCY, delay=MOCK_LLM_DELAY):
+    """
+    Конкурентные вызовы LLM из async-кода: блокирующий predict против apredict.
+
+    predict внутри async def блокирует цикл событий, поэтому вызовы идут
+    последовательно; apredict через общий пул выполняет их одновременно.
+    """
+    from models.models import YandexGPTLangChain, close_http_client
+
+    print_separator("БЕНЧМАРК: конкурентность LLM клиента (mock LLM)")
+    print(f"Одновременных вызовов: {concurrency}, задержка mock LLM: {delay * 1000:.0f} мс")
+
+    server = start_mock_llm(delay)
+    mock_llm = YandexGPTLangChain(api_url=f"http://127.0.0.1:{MOCK_LLM_PORT}", model_name="mock")
+
+    async def blocking_calls():
+        # Так обработчики вызывали LLM раньше: синхронно внутри async def
+        async def one(i):
+            return mock_llm.predict(f"Вопрос {i}")
+        return await asyncio.gather(*(one(i) for i in range(concurrency)))
+
+    async def async_calls():
+        try:
+            return await asyncio.gather(*(mock_llm.apredict(f"Вопрос {i}") for i in range(concurrency)))
+        finally:
+            await close_http_client()
+
+    try:
+        for name, calls in [("predict (блокирующий)", blocking_calls), ("apredict (пул)", async_calls)]:
+            started = time.perf_counter()
+            answers = asyncio.run(calls())
+            elapsed = time.perf_counter() - started
+            print(
+                f"   {name}: {elapsed * 1000:.0f} мс на {len(answers)} вызовов, "
+                f"{len(answers) / elapsed:.1f} вызовов/с"
+            )
+    finally:
+        server.shutdown()
+
+
+def bench_llm_failover(requests_count=CONCURRENCY, dead_url="http://127.0.0.1:9"):
+    """
+    Недоступная реплика рядом со здоровой: ни один запрос пользователя не должен
+    завершиться ошибкой. Недоступная реплика стоит первой и выбирается первой,
+    пока задержки обеих неизвестны; при одновременных запросах она получает
+    часть из них - они должны уйти на здоровую реплику повтором.
+    """
+    from models.balancer import LLMBalancer
+    from models.models import YandexGPTLangChain, close_http_client
+
+    print_separator("ТЕСТ: переключение с недоступной реплики LLM (mock LLM)")
+    print(f"Недоступная реплика: {dead_url}, запросов: {requests_count} последовательно и столько же одновременно")
+
+    server = start_mock_llm(delay=0.05)
+    balancer = LLMBalancer([dead_url, f"http://127.0.0.1:{MOCK_LLM_PORT}"], cooldown=0.2)
+    mock_llm = YandexGPTLangChain(api_url=dead_url, model_name="mock", balancer=balancer)
+
+    async def one(i):
+        try:
+            if i % 2:
+                return "".join([token async for token in mock_llm.stream_predict(f"Вопрос {i}")])
+            return await mock_llm.apredict(f"Вопрос {i}")
+        except Exception as e:
+            return e
+
+    async def calls():
+        try:
+            results = []
+            for i in range(requests_count):
+                results.append(await one(i))
+                # Недоступная реплика успевает вернуться в ротацию после cooldown
+                await asyncio.sleep(0.02)
+            results.extend(await asyncio.gather(*(one(i) for i in range(requests_count))))
+            return results
+        finally:
+            await close_http_client()
+
+    try:
+        results = asyncio.run(calls())
+    finally:
+        server.shutdown()
+
+    failed = [result for result in results if isinstance(result, Exception)]
+    dead, healthy = balancer.stats()
+    print(f"   Недоступная реплика: запросов {dead['requests']}, сбоев {dead['failures']}, переключений {dead['failovers']}")
+    print(f"   Здоровая реплика: запросов {healthy['requests']}")
+    if failed:
+        print(f"❌ Ошибкой завершилось запросов: {len(failed)} из {len(results)}: {failed[0]}")
+    else:
+        print(f"✅ Все {len(results)} запросов получили ответ")
+    return not failed
+
+
+def main():
+    """Основная функция запуска бенчмарков"""
+    print("🚀 ЗАПУСК БЕНЧМАРКОВ API")
+    print(f"Предварительное условие: сервер должен быть запущен на {BASE_URL}")
+
+    bench_llm_concurrency()
+    bench_llm_failover()
+    bench_ttft()
+
+    print_separator("БЕНЧМАРКИ ЗАВЕРШЕНЫ")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -6,6 +7,127 @@ model_url = os.getenv("MODEL_URL", "")
 model_name = os.getenv("MODEL_NAME", "")
 gigachat_token = os.getenv("GIGACHAT_TOKEN", "")
 
+# Реплики модели через запятую; без MODEL_URLS используется один MODEL_URL
+model_urls = [
+    url.strip().rstrip("/") for url in os.getenv("MODEL_URLS", "").split(",") if url.strip()
+] or [model_url]
+# Балансировка: сглаживание EWMA задержки, вывод реплики из ротации после N сбоев подряд на cooldown секунд
+llm_ewma_alpha = float(os.getenv("LLM_EWMA_ALPHA", "0.3"))
+llm_endpoint_failures = int(os.getenv("LLM_ENDPOINT_FAILURES", "3"))
+llm_endpoint_cooldown = float(os.getenv("LLM_ENDPOINT_COOLDOWN", "15"))
+
+# Пул keep-alive соединений к LLM бэкенду и таймауты (секунды)
+llm_pool_size = int(os.getenv("LLM_POOL_SIZE", "20"))
+llm_connect_timeout = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+llm_read_timeout = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+
+# Хеджирование: дубль запроса после p-го процентиля задержки эндпоинта (не раньше min_delay секунд)
+llm_hedge_enabled = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+llm_hedge_percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+llm_hedge_min_delay = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+llm_hedge_min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Автомат: размыкается после N сбоев подряд, пробует восстановиться через reset_timeout секунд
+llm_breaker_failures = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+llm_breaker_reset_timeout = float(os.getenv("LLM_BREAKER_RESET_TIMEOUT", "30"))
+
+# Лимиты генерации (max_tokens) по эндпоинтам
+llm_max_tokens = {
+    "get_answer": int(os.getenv("LLM_MAX_TOKENS_GET_ANSWER", "1024")),
+    "get_quiz": int(os.getenv("LLM_MAX_TOKENS_GET_QUIZ", "2048")),
+    "analyze_calibration": int(os.getenv("LLM_MAX_TOKENS_ANALYZE_CALIBRATION", "512")),
+    "get_scenario": int(os.getenv("LLM_MAX_TOKENS_GET_SCENARIO", "1024")),
+    "default": int(os.getenv("LLM_MAX_TOKENS_DEFAULT", "2048")),
+}
+
+# Кэш ответов LLM: размер, TTL (секунды) и эндпоинты, которые его используют
+llm_cache_size = int(os.getenv("LLM_CACHE_SIZE", "1000"))
+llm_cache_ttl = float(os.getenv("LLM_CACHE_TTL", "3600"))
+llm_cache_endpoints = [
+    name.strip() for name in os.getenv("LLM_CACHE_ENDPOINTS", "get_answer").split(",") if name.strip()
+]
+
+# RAG: off - без контекста, local - RAGAgent внутри процесса API,
+# remote - отдельный rag_api_server по адресу RAG_URL
+rag_mode = os.getenv("RAG_MODE", "off")
+rag_url = os.getenv("RAG_URL", "http://localhost:8022")
+rag_vector_store_dir = os.getenv(
+    "RAG_VECTOR_STORE_DIR",
+    str(Path(__file__).parent / "rag_agent" / "vector_store")
+)
+ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
+ollama_model = os.getenv("OLLAMA_MODEL", "bge-m3")
+rag_top_k = int(os.getenv("RAG_TOP_K", "5"))
+rag_max_context_length = int(os.getenv("RAG_MAX_CONTEXT_LENGTH", "2000"))
+# Клиент удалённого RAG: общий дедлайн на вызов, повторы, пакетирование и пул
+rag_timeout = float(os.getenv("RAG_TIMEOUT", "1.5"))
+rag_retries = int(os.getenv("RAG_RETRIES", "1"))
+rag_batch_window_ms = float(os.getenv("RAG_BATCH_WINDOW_MS", "5"))
+rag_batch_max_size = int(os.getenv("RAG_BATCH_MAX_SIZE", "16"))
+rag_pool_size = int(os.getenv("RAG_POOL_SIZE", "20"))
+
+# Сессии диалога /get_answer: размер хранилища, таймаут простоя (секунды),
+# окно последних реплик и порог сворачивания старых реплик в резюме (токены)
+chat_sessions_max = int(os.getenv("CHAT_SESSIONS_MAX", "1000"))
+chat_session_idle_timeout = float(os.getenv("CHAT_SESSION_IDLE_TIMEOUT", "1800"))
+chat_history_window_tokens = int(os.getenv("CHAT_HISTORY_WINDOW_TOKENS", "800"))
+chat_history_fold_tokens = int(os.getenv("CHAT_HISTORY_FOLD_TOKENS", "400"))
+chat_summary_max_tokens = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "200"))
+
+# Допуск к LLM: общий лимит одновременных вызовов, лимиты и приоритеты эндпоинтов
+# (меньше - раньше), размер очереди ожидания и максимальное ожидание в ней (секунды)
+admission_total_limit = int(os.getenv("ADMISSION_TOTAL_LIMIT", str(llm_pool_size)))
+admission_limits = {
+    "get_answer": int(os.getenv("ADMISSION_LIMIT_GET_ANSWER", "12")),
+    "analyze_calibration": int(os.getenv("ADMISSION_LIMIT_ANALYZE_CALIBRATION", "4")),
+    "get_quiz": int(os.getenv("ADMISSION_LIMIT_GET_QUIZ", "4")),
+    "get_scenario": int(os.getenv("ADMISSION_LIMIT_GET_SCENARIO", "4")),
+    "quiz_pool": int(os.getenv("ADMISSION_LIMIT_QUIZ_POOL", "2")),
+    "chat_summary": int(os.getenv("ADMISSION_LIMIT_CHAT_SUMMARY", "2")),
+}
+admission_priorities = {
+    "get_answer": 0,
+    "analyze_calibration": 1,
+    "get_quiz": 2,
+    "get_scenario": 2,
+    "quiz_pool": 3,
+    "chat_summary": 4,
+}
+admission_queue_size = int(os.getenv("ADMISSION_QUEUE_SIZE", "50"))
+admission_queue_timeout = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+admission_retry_after = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+
+# Контент в памяти: каталог кратких содержаний модулей и как часто (секунды)
+# проверять изменение файлов контента
+content_summary_dir = os.getenv("CONTENT_SUMMARY_DIR", "data/data_summary")
+content_check_interval = float(os.getenv("CONTENT_CHECK_INTERVAL", "2"))
+# Сколько секунд браузер может не перепроверять ответ /get_module (дальше - запрос с If-None-Match)
+module_cache_max_age = int(os.getenv("MODULE_CACHE_MAX_AGE", "60"))
+
+# Пул готовых викторин: сколько держать на модуль, число фоновых генераторов,
+# минимум новых для пользователя вопросов в выдаваемой викторине, сколько
+# пользователей помнить и максимальная пауза (секунды) после неудачной генерации
+quiz_pool_depth = int(os.getenv("QUIZ_POOL_DEPTH", "3"))
+quiz_pool_workers = int(os.getenv("QUIZ_POOL_WORKERS", "2"))
+quiz_pool_min_questions = int(os.getenv("QUIZ_POOL_MIN_QUESTIONS", "3"))
+quiz_pool_users_max = int(os.getenv("QUIZ_POOL_USERS_MAX", "10000"))
+quiz_pool_retry_max = float(os.getenv("QUIZ_POOL_RETRY_MAX", "300"))
+
+# Ситуационные задачи (/get_scenario): одновременных генераций на запрос, сколько
+# задач можно заказать и сколько дополнительных попыток на неудачные генерации
+scenario_concurrency = int(os.getenv("SCENARIO_CONCURRENCY", "3"))
+scenario_max_count = int(os.getenv("SCENARIO_MAX_COUNT", "5"))
+scenario_extra_attempts = int(os.getenv("SCENARIO_EXTRA_ATTEMPTS", "2"))
+
+# Таймаут (секунды) на текст обоснования калибровки от LLM (/analyze_calibration с llm_reasoning)
+calibration_reasoning_timeout = float(os.getenv("CALIBRATION_REASONING_TIMEOUT", "5"))
+
+# Логи: уровень, файл (пусто - только stdout), доля запросов с телами промпта/ответа
+# и сколько символов тяжёлых полей оставлять (остальное - длина и хэш)
+log_level = os.getenv("LOG_LEVEL", "INFO").upper()
+log_file = os.getenv("LOG_FILE", "")
+log_prompt_sample_rate = float(os.getenv("LOG_PROMPT_SAMPLE_RATE", "0.01"))
+log_field_max_chars = int(os.getenv("LOG_FIELD_MAX_CHARS", "500"))
+
 
 CONFIG = {
     'host': os.getenv("DB_HOST", ""),
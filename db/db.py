@@ -1,8 +1,25 @@
 import mysql.connector
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 
 from config import CONFIG
 
+# Сколько верных ответов (не меньше) в тесте модуля означает, что модуль пройден
+PASSED_CORRECTS = 5
+
+
+def level_for_passed_modules(passed_modules: int) -> str:
+    """Уровень пользователя по числу пройденных модулей"""
+    if passed_modules < 3:
+        return 'Новичок'
+    elif passed_modules < 7:
+        return 'Опытный'
+    elif passed_modules < 10:
+        return 'Профессионал'
+    elif passed_modules == 10:
+        return 'Эксперт'
+    else:
+        return 'Опытный'
+
 
 class DatabaseManager:
     def __init__(self):
@@ -95,6 +112,51 @@ class DatabaseManager:
             print(f"❌ Ошибка при создании теста: {e}")
             return None
 
+    def record_test_result(self, user_id: int, module_id: int, corrects: int) -> Optional[Tuple[int, int, str]]:
+        """
+        Записать результат теста и пересчитать уровень пользователя в одной транзакции
+
+        Returns:
+            (id теста, число пройденных модулей, новый уровень) или None, если пользователя нет или произошла ошибка
+        """
+        try:
+            self.connection.start_transaction()
+            cursor = self.connection.cursor()
+
+            # Блокируем строку пользователя: параллельные результаты одного пользователя пересчитают уровень по очереди
+            cursor.execute("SELECT id FROM users WHERE id = %s FOR UPDATE", (user_id,))
+            if cursor.fetchone() is None:
+                cursor.close()
+                self.connection.rollback()
+                print(f"❌ Пользователь с ID {user_id} не существует")
+                return None
+
+            cursor.execute(
+                "INSERT INTO tests (user_id, module_id, corrects) VALUES (%s, %s, %s)",
+                (user_id, module_id, corrects)
+            )
+            test_id = cursor.lastrowid
+
+            # Повторная сдача модуля не увеличивает число пройденных
+            cursor.execute(
+                "SELECT COUNT(DISTINCT module_id) FROM tests WHERE user_id = %s AND corrects >= %s",
+                (user_id, PASSED_CORRECTS)
+            )
+            passed_modules = cursor.fetchone()[0]
+            new_lvl = level_for_passed_modules(passed_modules)
+
+            cursor.execute("UPDATE users SET lvl = %s WHERE id = %s", (new_lvl, user_id))
+            cursor.close()
+            self.connection.commit()
+            return test_id, passed_modules, new_lvl
+        except mysql.connector.Error as e:
+            print(f"❌ Ошибка при записи результата теста: {e}")
+            try:
+                self.connection.rollback()
+            except mysql.connector.Error:
+                pass
+            return None
+
     def delete_user(self, user_id: int) -> bool:
         """Удалить пользователя"""
         try:
@@ -241,11 +303,11 @@ class DatabaseManager:
             return {}
         
     def get_total_tests_correct(self, user_id: int) -> int:
-        """Получить общее количество тестов с corrects=5 для указанного пользователя"""
+        """Получить количество пройденных (corrects >= PASSED_CORRECTS) модулей пользователя"""
         try:
             cursor = self.connection.cursor()
-            query = "SELECT COUNT(*) FROM tests WHERE user_id = %s AND corrects = 5"
-            cursor.execute(query, (user_id,))
+            query = "SELECT COUNT(DISTINCT module_id) FROM tests WHERE user_id = %s AND corrects >= %s"
+            cursor.execute(query, (user_id, PASSED_CORRECTS))
             result = cursor.fetchone()
             cursor.close()
             
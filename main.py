@@ -1,21 +1,53 @@
-from fastapi import FastAPI, HTTPException, UploadFile
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.routing import Match
+from pydantic import BaseModel, Field
 import logging
-from models.prompts import chat_template, calibration_chat_template
-from models.models import llm
-from models.rag import get_context
-from models.questions import generate_quiz_questions, get_context_quiz
+from models.prompts import chat_template, calibration_reasoning_template
+from models.models import llm, close_http_client, llm_breaker, llm_latency, llm_balancer
+from models.resilience import LLMUnavailableError
+from models.admission import admission, AdmissionRejected
+from models.calibration import CalibrationResult
+from models.content import content
+from models.http_cache import cached_json_response
+from models.json_repair import parse_stats
+from models.metrics import (
+    registry,
+    http_requests_total,
+    http_request_duration,
+    http_in_flight,
+    record_error,
+    stage_timer,
+)
+from models.tracing import span, TRACEPARENT_HEADER
+from models.log import setup_logging, log_llm_exchange
+from models.cache import llm_cache
+from models.tokens import token_meter
+from models.rag import get_context, init_rag, close_rag
+from models.sessions import session_store, ChatSession
+from models.questions import generate_quiz, generate_scenarios, get_context_quiz, get_fallback_quiz
+from models.quiz_pool import quiz_pool
+from models.singleflight import singleflight, fingerprint
 from models.speech import get_text_from_speech
-from db.db_router import db_router
+from db.db_router import db_router, db_manager
+from db.db import PASSED_CORRECTS
+from models.profiler import profiler_router
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Dict, Any, Optional
+import asyncio
 import json
+import time
+
+from config import calibration_reasoning_timeout, module_cache_max_age, scenario_max_count
+from quiz import update_quiz_from_module
 
-from quiz import update_quiz_from_module, load_quiz_data
 
+setup_logging()
 
 app = FastAPI(title="beZbot API", version="1.0.0")
 app.include_router(db_router)
+app.include_router(profiler_router)
 
 
 app.add_middleware(
@@ -27,12 +59,140 @@ app.add_middleware(
 )
 
 
+def _route_template(scope) -> str:
+    """Шаблон маршрута (/get_module/{module_id}) - метка метрик без id в пути."""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """Задержка, количество и запросы в обработке по маршрутам; корневой спан трассы."""
+    route = _route_template(request.scope)
+    http_in_flight.inc(route=route)
+    started = time.perf_counter()
+    status = 500
+    try:
+        with span(
+            f"{request.method} {route}",
+            traceparent=request.headers.get(TRACEPARENT_HEADER)
+        ) as current:
+            # Для потоковых ответов - время до начала ответа
+            response = await call_next(request)
+            status = response.status_code
+            current.set(status=status)
+            response.headers["X-Trace-Id"] = current.trace_id
+            return response
+    except Exception as e:
+        record_error(route, e)
+        raise
+    finally:
+        http_in_flight.dec(route=route)
+        http_request_duration.observe(time.perf_counter() - started, route=route, method=request.method)
+        http_requests_total.inc(route=route, method=request.method, status=str(status))
+
+
+def _llm_metrics():
+    """Статистика LLM клиента для /metrics."""
+    cache = llm_cache.stats()
+    yield ("bezbot_llm_cache_hits_total", "counter", "Попадания в кэш ответов LLM",
+           [({"endpoint": ep}, stats["hits"]) for ep, stats in cache["endpoints"].items()])
+    yield ("bezbot_llm_cache_misses_total", "counter", "Промахи кэша ответов LLM",
+           [({"endpoint": ep}, stats["misses"]) for ep, stats in cache["endpoints"].items()])
+    yield ("bezbot_llm_cache_entries", "gauge", "Записей в кэше ответов LLM", [({}, cache["size"])])
+
+    tokens = token_meter.stats()
+    yield ("bezbot_llm_tokens_total", "counter", "Токены LLM по эндпоинтам",
+           [({"endpoint": ep, "kind": kind}, stats[f"{kind}_tokens"])
+            for ep, stats in tokens.items() for kind in ("prompt", "completion")])
+    yield ("bezbot_llm_budget_exhausted_total", "counter", "Генерации, упёршиеся в max_tokens",
+           [({"endpoint": ep}, stats["budget_exhausted"]) for ep, stats in tokens.items()])
+
+    yield ("bezbot_llm_hedged_total", "counter", "Отправленные дублирующие запросы",
+           [({"endpoint": ep}, tracker.hedged) for ep, tracker in llm_latency.items()])
+
+    breaker = llm_breaker.stats()
+    state = {"closed": 0, "half_open": 1, "open": 2}[breaker["state"]]
+    yield ("bezbot_llm_breaker_state", "gauge", "Автомат LLM: 0 - closed, 1 - half_open, 2 - open", [({}, state)])
+    yield ("bezbot_llm_breaker_rejected_total", "counter", "Вызовы, отклонённые автоматом", [({}, breaker["rejected"])])
+
+    endpoints = llm_balancer.stats()
+    yield ("bezbot_llm_replica_outstanding", "gauge", "Запросы в работе на реплике",
+           [({"url": ep["url"]}, ep["outstanding"]) for ep in endpoints])
+    yield ("bezbot_llm_replica_healthy", "gauge", "Реплика в ротации",
+           [({"url": ep["url"]}, int(ep["healthy"])) for ep in endpoints])
+    yield ("bezbot_llm_replica_ewma_latency_seconds", "gauge", "EWMA задержки реплики",
+           [({"url": ep["url"]}, ep["ewma_latency_ms"] / 1000) for ep in endpoints if ep["ewma_latency_ms"] is not None])
+
+    gate = admission.stats()
+    yield ("bezbot_admission_active", "gauge", "Занятые слоты допуска к LLM",
+           [({"endpoint": ep}, stats["active"]) for ep, stats in gate["endpoints"].items()])
+    yield ("bezbot_admission_waiting", "gauge", "Запросы в очереди допуска", [({}, gate["waiting"])])
+    yield ("bezbot_admission_rejected_total", "counter", "Отказы допуска (429/503)",
+           [({"endpoint": ep, "reason": reason}, stats[reason])
+            for ep, stats in gate["endpoints"].items() for reason in ("rejected", "timed_out")])
+
+    parsing = parse_stats.stats()
+    yield ("bezbot_llm_json_parse_total", "counter",
+           "Разбор JSON ответов LLM: ok, repaired, recovered (оборван), retried (повторный запрос), failed",
+           [({"endpoint": ep, "result": result}, stats[result])
+            for ep, stats in parsing.items() for result in parse_stats.RESULTS])
+
+    flights = singleflight.stats()
+    yield ("bezbot_singleflight_total", "counter",
+           "Одинаковые одновременные запросы: executed - вычислены, shared - получили чужой результат",
+           [({"endpoint": ep, "result": result}, stats[result])
+            for ep, stats in flights["endpoints"].items() for result in ("executed", "shared")])
+
+    pool = quiz_pool.stats()
+    yield ("bezbot_quiz_pool_depth", "gauge", "Готовые викторины в пуле по модулям",
+           [({"module": module_id}, depth) for module_id, depth in pool["modules"].items()])
+    yield ("bezbot_quiz_pool_served_total", "counter", "Выдачи /get_quiz: из пула (hit) и генерацией на лету (miss)",
+           [({"result": "hit"}, pool["served_from_pool"]), ({"result": "miss"}, pool["pool_misses"])])
+    yield ("bezbot_quiz_pool_generation_failures_total", "counter", "Неудачные фоновые генерации викторин",
+           [({}, pool["generation_failures"])])
+
+
+registry.register_collector(_llm_metrics)
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Загрузка общих для процесса ресурсов при запуске сервера."""
+    await init_rag()
+    quiz_pool.start(content.snapshot().module_ids())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Закрытие соединений при остановке сервера."""
+    await quiz_pool.stop()
+    await close_rag()
+    await close_http_client()
+
+
+# Вопросы модуля меняются только с quiz.json: браузер может не перепроверять их max-age секунд
+MODULE_CACHE_CONTROL = f"public, max-age={module_cache_max_age}"
+
+# Ответы, когда LLM бэкенд недоступен (автомат разомкнут)
+LLM_UNAVAILABLE_ANSWER = (
+    "Сервис ответов временно перегружен. Попробуйте повторить вопрос через минуту "
+    "или обратитесь к документам из списка источников."
+)
+
+
 class CalibrationResultRequest(BaseModel):
-    answers: Dict[str, str]  # {'question': 'answer'}
+    answers: Dict[str, str]  # {'question1': 'текст выбранного варианта'}
+    llm_reasoning: bool = False  # обоснование пишет LLM (дольше), иначе - шаблон
 
 class SkipModulesResponse(BaseModel):
     skipped_modules: List[int]
     message: str
+    score: Optional[int] = None
+    level: Optional[str] = None
 
 
 class SpeechResponse(BaseModel):
@@ -48,23 +208,40 @@ class ModuleResponse(BaseModel):
     module_name: str
     questions: List[Dict[str, Any]]
     total_questions: int
+    variant: Optional[int] = None  # версия вопросов (None - по умолчанию), передаётся в /submit_module
+
+
+class ModuleSummary(BaseModel):
+    module_id: int
+    module_name: str
+    total_questions: int
+
+
+class ModulesResponse(BaseModel):
+    modules: List[ModuleSummary]
+    questions: Optional[Dict[str, List[Dict[str, Any]]]] = None  # номер модуля -> вопросы (если запрошены)
+    variants: Optional[Dict[str, Optional[int]]] = None  # номер модуля -> версия вопросов
 
 
 class QuestionRequest(BaseModel):
     question: str
+    session_id: Optional[str] = Field(None, max_length=64)  # id диалога из предыдущего ответа
 
 
 class QuizRequest(BaseModel):
     id: str
+    user_id: Optional[int] = None  # чтобы не повторять уже выданные пользователю вопросы
 
 
 class ScenarioRequest(BaseModel):
     id: str
+    count: int = Field(1, ge=1, le=scenario_max_count)  # сколько задач сгенерировать
 
 
 class AnswerResponse(BaseModel):
     answer: str
     metadata: list
+    session_id: Optional[str] = None
 
 
 class QuizResponse(BaseModel):
@@ -85,85 +262,337 @@ class UpdateModuleResponse(BaseModel):
     message: str
 
 
+class SubmitModuleRequest(BaseModel):
+    user_id: int
+    module_id: int
+    answers: List[int]  # номер выбранного варианта (с 0) для каждого вопроса по порядку
+    variant: Optional[int] = None  # версия вопросов из /get_module (None - версия по умолчанию)
+
+
+class SubmitModuleResponse(BaseModel):
+    test_id: int
+    module_id: int
+    corrects: int
+    total_questions: int
+    results: List[bool]  # верен ли ответ на каждый вопрос
+    passed: bool
+    passed_modules: int
+    level: str
+
+
 @app.post("/get_answer", response_model=AnswerResponse)
 async def get_answer(request: QuestionRequest):
     """Отвечает на вопрос: сначала проверяет FAQ, потом использует RAG + LLM."""
     
+    started = time.perf_counter()
     try:
-        context = get_context()
-        # Строим промпт с учётом историизкщьзе = context
-        prompt = chat_template.format(context=context, question=request.question)
-        
-        logging.error(prompt)
+        session = session_store.get(request.session_id)
+
+        async def answer_question():
+            context, sources = await get_context(_retrieval_query(session, request.question))
+            # Строим промпт с учётом контекста и истории диалога
+            with span("prompt_build"):
+                prompt = chat_template.format(
+                    context=context,
+                    history=session.history_text(),
+                    question=request.question
+                )
+            try:
+                async with admission.slot("get_answer"):
+                    answer = await llm.apredict(prompt, endpoint="get_answer")
+            except LLMUnavailableError:
+                return None, sources, prompt
+            return answer.strip(), sources, prompt
+
+        if not session.turns and not session.summary:
+            # Без истории промпт зависит только от вопроса: одинаковые одновременные вопросы - один вызов LLM
+            answer, sources, prompt = await singleflight.do(fingerprint("get_answer", request.question), answer_question)
+        else:
+            answer, sources, prompt = await answer_question()
+
+        if answer is None:
+            # Не ждём таймаута и не пишем заглушку в историю диалога
+            logging.warning("/get_answer: LLM недоступен, отдаём заглушку")
+            return AnswerResponse(
+                answer=LLM_UNAVAILABLE_ANSWER,
+                metadata=sources,
+                session_id=session.session_id
+            )
         
-        answer = llm.predict(prompt)
+        log_llm_exchange(
+            "get_answer", prompt, answer,
+            total_ms=round((time.perf_counter() - started) * 1000)
+        )
 
-        answer = answer.strip()
-        
-        logging.error(answer)
+        session_store.record_turn(session, request.question, answer)
 
         return AnswerResponse(
             answer=answer,
-            metadata=[]
+            metadata=sources,
+            session_id=session.session_id
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
+        record_error("/get_answer", e)
         logging.error(f"Ошибка при обработке запроса: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка при обработке запроса: {str(e)}")
 
 
+def _retrieval_query(session: ChatSession, question: str) -> str:
+    """Запрос к базе знаний: уточняющий вопрос дополняем предыдущим вопросом диалога."""
+    last_question = session.last_question()
+    return f"{last_question}\n{question}" if last_question else question
+
+
+def _sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Формирует одно событие Server-Sent Events."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/get_answer_stream")
+async def get_answer_stream(request: QuestionRequest):
+    """
+    Отвечает на вопрос потоково: токены LLM уходят клиенту как Server-Sent Events.
+
+    События: metadata (источники и session_id), безымянные data с {"token": ...},
+    done (полный ответ и замеры TTFT/общего времени) или error.
+    """
+    started = time.perf_counter()
+    session = session_store.get(request.session_id)
+    context, sources = await get_context(_retrieval_query(session, request.question))
+    with span("prompt_build"):
+        prompt = chat_template.format(
+            context=context,
+            history=session.history_text(),
+            question=request.question
+        )
+    # Слот берём до начала ответа, чтобы при перегрузке успеть вернуть 429/503
+    ticket = await admission.acquire("get_answer")
+
+    async def event_stream():
+        first_token_at = None
+        parts = []
+
+        yield _sse({"metadata": sources, "session_id": session.session_id}, event="metadata")
+
+        try:
+            async for token in llm.stream_predict(prompt, endpoint="get_answer"):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(token)
+                yield _sse({"token": token})
+        except LLMUnavailableError:
+            logging.warning("/get_answer_stream: LLM недоступен, отдаём заглушку")
+            yield _sse({"token": LLM_UNAVAILABLE_ANSWER})
+            yield _sse({
+                "answer": LLM_UNAVAILABLE_ANSWER,
+                "ttft_ms": round((time.perf_counter() - started) * 1000),
+                "total_ms": round((time.perf_counter() - started) * 1000)
+            }, event="done")
+            return
+        except Exception as e:
+            record_error("/get_answer_stream", e)
+            logging.error(f"Ошибка при потоковой генерации ответа: {e}")
+            yield _sse({"detail": f"Ошибка при обработке запроса: {str(e)}"}, event="error")
+            return
+        finally:
+            ticket.release()
+
+        finished = time.perf_counter()
+        ttft_ms = round(((first_token_at or finished) - started) * 1000)
+        total_ms = round((finished - started) * 1000)
+        answer = "".join(parts).strip()
+        log_llm_exchange("get_answer_stream", prompt, answer, ttft_ms=ttft_ms, total_ms=total_ms)
+        session_store.record_turn(session, request.question, answer)
+
+        yield _sse({
+            "answer": answer,
+            "ttft_ms": ttft_ms,
+            "total_ms": total_ms
+        }, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # На случай, если поток так и не начали читать
+        background=BackgroundTask(ticket.release)
+    )
+
+
 @app.get("/get_module/{module_id}", response_model=ModuleResponse)
-async def get_module(module_id: int):
-    test_names, tests = load_quiz_data()
+async def get_module(module_id: int, request: Request, user_id: Optional[int] = None):
+    """
+    Вопросы модуля (с user_id - в версии пользователя). Ответ собран и сжат
+    заранее при загрузке контента; повторный запрос с If-None-Match получает 304.
+    """
     try:
+        snapshot = content.snapshot()
+
         # Проверяем существование модуля
-        if module_id not in tests:
+        body = snapshot.module_response(module_id, user_id)
+        if body is None:
             raise HTTPException(status_code=404, detail="Модуль не найден")
+
+        return cached_json_response(request, body, MODULE_CACHE_CONTROL)
         
-        # Получаем вопросы модуля
-        module_questions = tests[module_id]
-        
-        # Словарь с названиями модулей
-        test_names = {
-            0: "КАЛИБРОВОЧНЫЙ ТЕСТ",
-            1: "История и миссия", 
-            2: "Структура и активы",
-            3: "Технологии и модернизация",
-            4: "Безопасность и экология",
-            5: "Персонал и корпоративная культура",
-            6: "Социальная ответственность",
-            7: "Инновации и цифровизация",
-            8: "Экономика и эффективность",
-            9: "Перспективы и стратегия",
-            10: "Регламенты и нормативная документация"
-        }
-        
-        module_name = test_names.get(module_id, f"Модуль {module_id}")
-        
-        return {
-            "module_id": module_id,
-            "module_name": module_name,
-            "questions": module_questions,
-            "total_questions": len(module_questions)
-        }
-        
+    except HTTPException:
+        raise
     except Exception as e:
+        record_error("/get_module/{module_id}", e)
         logging.error(f"Ошибка при обработке запроса: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка при обработке запроса: {str(e)}")
 
 
+@app.get("/modules", response_model=ModulesResponse)
+async def get_modules(request: Request, include: Optional[str] = None, user_id: Optional[int] = None):
+    """
+    Каталог модулей (номер, название, число вопросов) и, если указан include
+    ("1,2,3" или "all"), вопросы этих модулей в версиях пользователя - всё
+    одним ответом из заранее собранного снимка, с ETag.
+    """
+    try:
+        snapshot = content.snapshot()
+
+        module_ids: List[int] = []
+        if include == "all":
+            module_ids = list(snapshot.tests)
+        elif include:
+            try:
+                module_ids = [int(part) for part in include.split(",") if part.strip()]
+            except ValueError:
+                raise HTTPException(status_code=422, detail="include - номера модулей через запятую или all")
+            missing = [module_id for module_id in module_ids if module_id not in snapshot.tests]
+            if missing:
+                raise HTTPException(status_code=404, detail=f"Модули не найдены: {missing}")
+
+        body = snapshot.bundle_response(module_ids, user_id)
+        return cached_json_response(request, body, MODULE_CACHE_CONTROL)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        record_error("/modules", e)
+        logging.error(f"Ошибка при получении каталога модулей: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при обработке запроса: {str(e)}")
+
+
+@app.post("/submit_module", response_model=SubmitModuleResponse)
+async def submit_module(request: SubmitModuleRequest):
+    """
+    Проверяет ответы на тест модуля по ключу из памяти (в той версии вопросов,
+    которую клиент получил из /get_module), записывает результат и обновляет
+    уровень одной транзакцией.
+    """
+    try:
+        snapshot = content.snapshot()
+        if request.module_id == 0:
+            raise HTTPException(status_code=400, detail="Калибровочный тест оценивается через /analyze_calibration")
+        if request.module_id not in snapshot.tests:
+            raise HTTPException(status_code=404, detail="Модуль не найден")
+
+        questions = snapshot.questions(request.module_id, request.variant)
+        if questions is None:
+            raise HTTPException(status_code=422, detail=f"Неизвестная версия вопросов: {request.variant}")
+        if len(request.answers) != len(questions):
+            raise HTTPException(
+                status_code=422,
+                detail=f"Ожидается ответов: {len(questions)}, получено: {len(request.answers)}"
+            )
+
+        results = [answer == question.get("c") for answer, question in zip(request.answers, questions)]
+        corrects = sum(results)
+
+        with stage_timer("db"):
+            recorded = db_manager.record_test_result(request.user_id, request.module_id, corrects)
+        if recorded is None:
+            raise HTTPException(status_code=404, detail="Пользователь не найден или не удалось записать результат")
+        test_id, passed_modules, level = recorded
+
+        return SubmitModuleResponse(
+            test_id=test_id,
+            module_id=request.module_id,
+            corrects=corrects,
+            total_questions=len(questions),
+            results=results,
+            passed=corrects >= PASSED_CORRECTS,
+            passed_modules=passed_modules,
+            level=level
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        record_error("/submit_module", e)
+        logging.error(f"Ошибка при проверке теста модуля: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при проверке теста: {str(e)}")
+
+
 @app.post("/get_quiz", response_model=QuizResponse)
 async def get_quiz(request: QuizRequest):
-    """Генерирует проверочную викторину на основе контекста."""
+    """
+    Проверочная викторина по модулю: готовая из пула, а если пул модуля
+    пуст - генерация на лету.
+    """
     try:
-        context = get_context_quiz(request.id)
-        response = generate_quiz_questions(context)
-        return QuizResponse(quiz=response)
+        snapshot = content.snapshot()
+        try:
+            module_id = int(request.id)
+        except ValueError:
+            module_id = None
+        if module_id not in snapshot.module_ids():
+            raise HTTPException(status_code=404, detail=f"Модуль {request.id} не найден")
+
+        quiz = quiz_pool.take(module_id, request.user_id)
+        if quiz is not None:
+            return QuizResponse(quiz=quiz)
+
+        context = get_context_quiz(module_id)
+
+        async def generate():
+            async with admission.slot("get_quiz"):
+                return await generate_quiz(context)
+
+        try:
+            # Одновременные запросы одного модуля ждут одну генерацию
+            quiz = await singleflight.do(fingerprint("get_quiz", module_id), generate)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logging.error(f"Ошибка при генерации викторины, выдаём запасную: {e}")
+            return QuizResponse(quiz=get_fallback_quiz())
+        quiz_pool.mark_served(module_id, request.user_id, quiz)
+        return QuizResponse(quiz=quiz)
+    except HTTPException:
+        raise
     except Exception as e:
+        record_error("/get_quiz", e)
         logging.error(f"Ошибка при генерации викторины: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка при генерации викторины: {str(e)}")
 
 
+@app.post("/get_scenario", response_model=ScenarioResponse)
+async def get_scenario(request: ScenarioRequest):
+    """Ситуационные задачи по модулю: count задач генерируются параллельно."""
+    try:
+        try:
+            context = get_context_quiz(request.id)
+        except FileNotFoundError:
+            # Без краткого содержания модуля задачи строятся только по теме
+            context = content.snapshot().module_name(int(request.id)) if request.id.isdigit() else ""
+        scenarios = await generate_scenarios(context, request.count)
+        return ScenarioResponse(scenario=scenarios)
+    except HTTPException:
+        raise
+    except Exception as e:
+        record_error("/get_scenario", e)
+        logging.error(f"Ошибка при генерации сценариев: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при генерации сценариев: {str(e)}")
+
+
 @app.post('/speech_to_text', response_model=SpeechResponse)
 async def speech_to_text(file: UploadFile):
     try:
@@ -175,70 +604,87 @@ async def speech_to_text(file: UploadFile):
         return {'text': text}
 
     except Exception as e:
+        record_error("/speech_to_text", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
 @app.post("/analyze_calibration", response_model=SkipModulesResponse)
 async def analyze_calibration(request: CalibrationResultRequest):
-    """Анализирует результаты калибровочного теста и рекомендует модули для пропуска."""
-    test_names, tests = load_quiz_data()
+    """
+    Оценивает калибровочный тест по весам ответов и рекомендует модули для пропуска.
+
+    Решение принимается локально; LLM вызывается, только если запрошено
+    llm_reasoning, и лишь для текста обоснования.
+    """
     try:
-        
-        logging.error(f"Analyzing calibration results: {request.answers}")
-        
-        prompt = calibration_chat_template.format(answers=request.answers)
-        
-        # Получаем ответ от LLM
-        analysis_result = llm.predict(prompt).strip()
-        
-        logging.error(analysis_result)
-        
-        # Парсим JSON ответ
-        try:
-            result_data = json.loads(analysis_result.replace('```', ''))
-            skipped_modules = result_data.get("skipped_modules", [])
-            reasoning = result_data.get("reasoning", "Анализ завершен")
-            
-            # Проверяем, что не пропускаем все модули
-            total_modules = len(test_names) - 1  # исключаем калибровочный
-            if len(skipped_modules) >= total_modules - 3:  # оставляем минимум 4 модуля
-                skipped_modules = skipped_modules[:total_modules - 4]
-            
-            # Убеждаемся, что модуль 0 не включен
-            if 0 in skipped_modules:
-                skipped_modules.remove(0)
-                
-            logging.info(f"Recommended to skip modules: {skipped_modules}, reasoning: {reasoning}")
-            
-            return SkipModulesResponse(
-                skipped_modules=skipped_modules,
-                message=reasoning
-            )
-            
-        except json.JSONDecodeError:
-            logging.error(f"Failed to parse LLM response: {analysis_result}")
-            # Fallback: возвращаем пустой список при ошибке парсинга
-            return SkipModulesResponse(
-                skipped_modules=[],
-                message="Рекомендуем пройти все модули для полноценного обучения"
-            )
+        result = content.snapshot().scorer.evaluate(request.answers)
+        message = result.message
+
+        if request.llm_reasoning:
+            message = await _calibration_reasoning(request.answers, result) or message
+
+        logging.info(
+            "Calibration scored",
+            extra={"score": result.score, "level": result.level, "skipped_modules": result.skipped_modules}
+        )
+        return SkipModulesResponse(
+            skipped_modules=result.skipped_modules,
+            message=message,
+            score=result.score,
+            level=result.level
+        )
 
     except Exception as e:
+        record_error("/analyze_calibration", e)
         logging.error(f"Ошибка при анализе калибровочного теста: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка при анализе результатов: {str(e)}")
 
 
+async def _calibration_reasoning(answers: Dict[str, str], result: CalibrationResult) -> Optional[str]:
+    """Текст обоснования от LLM; None, если LLM недоступен или не уложился в таймаут."""
+    test_names = content.snapshot().scorer.test_names
+    skipped = ", ".join(test_names[module_id] for module_id in result.skipped_modules) or "нет"
+    prompt = calibration_reasoning_template.format(
+        answers=answers,
+        score=result.score,
+        max_score=result.max_score,
+        level=result.level,
+        skipped=skipped
+    )
+    try:
+        async with admission.slot("analyze_calibration"):
+            reasoning = await asyncio.wait_for(
+                llm.apredict(prompt, endpoint="analyze_calibration"),
+                calibration_reasoning_timeout
+            )
+    except (asyncio.TimeoutError, LLMUnavailableError, AdmissionRejected) as e:
+        logging.warning(f"/analyze_calibration: обоснование от LLM не получено ({type(e).__name__})")
+        return None
+    except Exception as e:
+        record_error("/analyze_calibration", e)
+        logging.error(f"Ошибка при получении обоснования калибровки: {e}")
+        return None
+
+    reasoning = reasoning.strip()
+    log_llm_exchange("analyze_calibration", prompt, reasoning)
+    return reasoning or None
+
+
 @app.post("/update_module", response_model=UpdateModuleResponse)
 async def update_module(request: UpdateModuleRequest):
     """Обновляет версию вопросов для указанного модуля."""
     try:
-        success = update_quiz_from_module(
+        # Запись ждёт блокировку quiz.json - не в цикле событий
+        success = await asyncio.to_thread(
+            update_quiz_from_module,
             module_id=request.module_id,
             module_name=request.module_name
         )
         
         if success:
+            # Новая версия вопросов видна сразу, не дожидаясь проверки файлов
+            content.reload()
             return UpdateModuleResponse(
                 success=True,
                 message=f"Модуль {request.module_id} успешно обновлён"
@@ -249,6 +695,7 @@ async def update_module(request: UpdateModuleRequest):
                 message=f"Ошибка при обновлении модуля {request.module_id}"
             )
     except Exception as e:
+        record_error("/update_module", e)
         logging.error(f"Ошибка при обновлении модуля: {e}")
         raise HTTPException(
             status_code=500,
@@ -256,6 +703,29 @@ async def update_module(request: UpdateModuleRequest):
         )
 
 
+@app.get('/llm_stats')
+async def llm_stats():
+    """Статистика LLM клиента: кэш, токены, задержки, автомат, реплики, допуск запросов, разбор JSON, схлопывание запросов, пул викторин и контент."""
+    return {
+        'cache': llm_cache.stats(),
+        'tokens': token_meter.stats(),
+        'latency': {endpoint: tracker.stats() for endpoint, tracker in llm_latency.items()},
+        'breaker': llm_breaker.stats(),
+        'endpoints': llm_balancer.stats(),
+        'admission': admission.stats(),
+        'json_parse': parse_stats.stats(),
+        'singleflight': singleflight.stats(),
+        'quiz_pool': quiz_pool.stats(),
+        'content': content.stats()
+    }
+
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    """Метрики в текстовом формате Prometheus."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get('/')
 async def test_root():
 
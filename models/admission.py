@@ -0,0 +1,190 @@
+"""
+Допуск запросов к LLM.
+
+У каждого эндпоинта свой лимит одновременных вызовов, плюс общий лимит на
+процесс. Запросы сверх лимита ждут в общей ограниченной очереди, откуда
+освободившиеся слоты раздаются по приоритету: диалог (/get_answer) раньше
+генерации викторин. Если очередь заполнена, запрос сразу получает 429
+(или вытесняет из очереди запрос ниже приоритетом), если не дождался
+слота за ADMISSION_QUEUE_TIMEOUT - 503; оба с Retry-After.
+"""
+
+import asyncio
+import bisect
+import itertools
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from models.tracing import span
+from config import (
+    admission_total_limit,
+    admission_limits,
+    admission_priorities,
+    admission_queue_size,
+    admission_queue_timeout,
+    admission_retry_after,
+)
+
+
+class AdmissionRejected(HTTPException):
+    """Запрос не допущен к LLM: очередь заполнена или ожидание истекло."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int = admission_retry_after):
+        super().__init__(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+
+
+class Ticket:
+    """Занятый слот; release можно вызывать повторно."""
+
+    def __init__(self, controller: "AdmissionController", endpoint: str):
+        self._controller = controller
+        self.endpoint = endpoint
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._controller._release(self.endpoint)
+
+
+class AdmissionController:
+    """Лимиты одновременных вызовов и приоритетная очередь ожидания."""
+
+    def __init__(
+        self,
+        total_limit: int = admission_total_limit,
+        limits: Optional[Dict[str, int]] = None,
+        priorities: Optional[Dict[str, int]] = None,
+        queue_size: int = admission_queue_size,
+        queue_timeout: float = admission_queue_timeout
+    ):
+        self.total_limit = total_limit
+        self.limits = dict(admission_limits if limits is None else limits)
+        self.priorities = dict(admission_priorities if priorities is None else priorities)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+
+        self._active: Dict[str, int] = {}
+        self._total_active = 0
+        # (приоритет, порядковый номер, эндпоинт, future) - отсортировано
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _endpoint_stats(self, endpoint: str) -> Dict[str, int]:
+        return self._stats.setdefault(endpoint, {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0})
+
+    def _has_capacity(self, endpoint: str) -> bool:
+        limit = self.limits.get(endpoint, self.total_limit)
+        return self._total_active < self.total_limit and self._active.get(endpoint, 0) < limit
+
+    def _take(self, endpoint: str):
+        self._active[endpoint] = self._active.get(endpoint, 0) + 1
+        self._total_active += 1
+        self._endpoint_stats(endpoint)["admitted"] += 1
+
+    def _release(self, endpoint: str):
+        self._active[endpoint] -= 1
+        self._total_active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Раздаёт свободные слоты ожидающим в порядке приоритета."""
+        i = 0
+        while i < len(self._waiters) and self._total_active < self.total_limit:
+            _, _, endpoint, future = self._waiters[i]
+            if self._has_capacity(endpoint):
+                # Эндпоинт, упёршийся в свой лимит, не задерживает остальных
+                del self._waiters[i]
+                self._take(endpoint)
+                future.set_result(None)
+            else:
+                i += 1
+
+    async def acquire(self, endpoint: str) -> Ticket:
+        """Ждёт слот для эндпоинта или выбрасывает AdmissionRejected."""
+        stats = self._endpoint_stats(endpoint)
+        priority = self.priorities.get(endpoint, max(self.priorities.values(), default=0) + 1)
+
+        # Очередь и "впереди" считаем только по живым ожидающим
+        self._drop_done_waiters()
+        # Сразу проходим, только если никто с тем же или более высоким приоритетом не ждёт
+        ahead = any(waiter[0] <= priority for waiter in self._waiters)
+        if not ahead and self._has_capacity(endpoint):
+            self._take(endpoint)
+            return Ticket(self, endpoint)
+
+        if len(self._waiters) >= self.queue_size:
+            worst_priority, _, worst_endpoint, worst_future = self._waiters[-1]
+            if worst_priority <= priority:
+                stats["rejected"] += 1
+                raise AdmissionRejected(429, "Слишком много запросов, повторите позже")
+            # Очередь полна, но в её конце запрос ниже приоритетом - вытесняем его
+            self._waiters.pop()
+            self._endpoint_stats(worst_endpoint)["rejected"] += 1
+            worst_future.set_exception(AdmissionRejected(429, "Слишком много запросов, повторите позже"))
+
+        future = asyncio.get_running_loop().create_future()
+        bisect.insort(self._waiters, (priority, next(self._seq), endpoint, future))
+        stats["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except AdmissionRejected:
+            raise
+        except asyncio.TimeoutError:
+            if not self._cancel_waiter(future, endpoint):
+                return Ticket(self, endpoint)
+            stats["timed_out"] += 1
+            raise AdmissionRejected(503, "Сервис перегружен, повторите позже")
+        except asyncio.CancelledError:
+            if not self._cancel_waiter(future, endpoint):
+                # Слот уже выдан, но клиент ушёл - возвращаем
+                self._release(endpoint)
+            raise
+        return Ticket(self, endpoint)
+
+    def _cancel_waiter(self, future: asyncio.Future, endpoint: str) -> bool:
+        """Убирает ожидающего из очереди. False - слот ему уже выдан."""
+        if future.done():
+            # Вытесненному из очереди слот не выдавался
+            return future.exception() is not None
+        future.cancel()
+        # Отменённый не должен занимать место в очереди и считаться стоящим впереди
+        self._drop_done_waiters()
+        self._dispatch()
+        return True
+
+    def _drop_done_waiters(self):
+        self._waiters = [waiter for waiter in self._waiters if not waiter[3].done()]
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str) -> AsyncIterator[Ticket]:
+        """Держит слот эндпоинта на время блока."""
+        with span("admission", endpoint=endpoint):
+            ticket = await self.acquire(endpoint)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, stats in self._stats.items():
+            endpoints[endpoint] = {
+                **stats,
+                "active": self._active.get(endpoint, 0),
+                "limit": self.limits.get(endpoint, self.total_limit)
+            }
+        return {
+            "active": self._total_active,
+            "total_limit": self.total_limit,
+            "waiting": len(self._waiters),
+            "queue_size": self.queue_size,
+            "endpoints": endpoints
+        }
+
+
+# Общий контроллер на процесс
+admission = AdmissionController()
@@ -0,0 +1,145 @@
+"""
+Балансировка вызовов LLM между репликами модели.
+
+Каждый вызов уходит на реплику с наименьшим числом запросов в работе, при
+равенстве - с меньшей EWMA задержкой. Реплика без успешных ответов (например,
+недоступная с самого старта) при равенстве идёт после реплик с известной
+задержкой. Реплика, сбоившая LLM_ENDPOINT_FAILURES раз подряд, выводится из
+ротации на LLM_ENDPOINT_COOLDOWN секунд; после этого она снова получает
+запросы, и первый же сбой выводит её опять. Запрос, не дошедший до реплики,
+вызывающий повторяет один раз на другой здоровой реплике (см. alternative).
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Collection, Dict, Iterable, Iterator, List, Optional
+
+from config import (
+    llm_ewma_alpha,
+    llm_endpoint_failures,
+    llm_endpoint_cooldown,
+)
+
+
+class LLMEndpoint:
+    """Одна реплика модели и её счётчики."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.failovers = 0
+        self.unhealthy_until = 0.0
+
+    def healthy(self, now: float) -> bool:
+        return self.unhealthy_until <= now
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy(time.monotonic()),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "failovers": self.failovers,
+            "ewma_latency_ms": round(self.ewma_latency * 1000) if self.ewma_latency is not None else None
+        }
+
+
+class LLMBalancer:
+    """Выбор реплики по наименьшему числу запросов в работе."""
+
+    def __init__(
+        self,
+        urls: Iterable[str],
+        alpha: float = llm_ewma_alpha,
+        failure_threshold: int = llm_endpoint_failures,
+        cooldown: float = llm_endpoint_cooldown
+    ):
+        self.endpoints: List[LLMEndpoint] = [LLMEndpoint(url) for url in urls]
+        if not self.endpoints:
+            raise ValueError("Не задано ни одной реплики LLM")
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+    def _healthy(self, exclude: Collection[str] = ()) -> List[LLMEndpoint]:
+        now = time.monotonic()
+        return [endpoint for endpoint in self.endpoints if endpoint.healthy(now) and endpoint.url not in exclude]
+
+    def pick(self, exclude: Collection[str] = ()) -> LLMEndpoint:
+        """Реплика для следующего запроса; exclude - URL реплик, которые уже пробовали."""
+        healthy = self._healthy(exclude)
+        if not healthy:
+            # Все выведены - пробуем ту, что вернётся в ротацию раньше всех
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.url not in exclude] or self.endpoints
+            return min(candidates, key=lambda endpoint: endpoint.unhealthy_until)
+
+        # Неизвестная задержка - не "самая быстрая": пока хоть у одной реплики есть
+        # данные, реплика без успешных ответов идёт последней среди равных по нагрузке
+        known = any(endpoint.ewma_latency is not None for endpoint in healthy)
+        unknown_latency = float("inf") if known else 0.0
+        return min(
+            healthy,
+            key=lambda endpoint: (
+                endpoint.outstanding,
+                endpoint.ewma_latency if endpoint.ewma_latency is not None else unknown_latency
+            )
+        )
+
+    def alternative(self, tried: Collection[str]) -> bool:
+        """Есть ли здоровая реплика, которую ещё не пробовали (для повтора запроса)."""
+        return bool(self._healthy(tried))
+
+    def record_failover(self, url: str):
+        """Учитывает запрос, перенесённый с реплики url на другую."""
+        for endpoint in self.endpoints:
+            if endpoint.url == url:
+                endpoint.failovers += 1
+
+    def record(self, endpoint: LLMEndpoint, elapsed: float, failed: bool):
+        """Учитывает завершённый запрос."""
+        endpoint.requests += 1
+        if failed:
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.failure_threshold:
+                if endpoint.healthy(time.monotonic()):
+                    endpoint.ejections += 1
+                endpoint.unhealthy_until = time.monotonic() + self.cooldown
+            return
+
+        endpoint.consecutive_failures = 0
+        if endpoint.ewma_latency is None:
+            endpoint.ewma_latency = elapsed
+        else:
+            endpoint.ewma_latency = self.alpha * elapsed + (1 - self.alpha) * endpoint.ewma_latency
+
+    @contextmanager
+    def route(self, is_failure: Callable[[BaseException], bool], exclude: Collection[str] = ()) -> Iterator[str]:
+        """
+        Выбирает реплику на время запроса и отдаёт её URL.
+
+        Исключение из блока учитывается как сбой, если is_failure(e) истинно;
+        отмена запроса на здоровье реплики не влияет. exclude - как в pick.
+        """
+        endpoint = self.pick(exclude)
+        endpoint.outstanding += 1
+        started = time.monotonic()
+        try:
+            yield endpoint.url
+        except Exception as e:
+            self.record(endpoint, time.monotonic() - started, failed=is_failure(e))
+            raise
+        else:
+            self.record(endpoint, time.monotonic() - started, failed=False)
+        finally:
+            endpoint.outstanding -= 1
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [endpoint.stats() for endpoint in self.endpoints]
@@ -0,0 +1,160 @@
+"""
+Кэш ответов LLM.
+
+Ключ - хэш промпта, имени модели и параметров сэмплирования. Записи живут
+не дольше TTL, при переполнении вытесняются давно не использованные.
+Кэш сбрасывается целиком, когда меняется версия контента: файлы векторного
+хранилища RAG или quiz.json.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import (
+    llm_cache_size,
+    llm_cache_ttl,
+    llm_cache_endpoints,
+    rag_vector_store_dir,
+)
+from quiz import QUIZ_JSON_PATH
+
+
+class LLMResponseCache:
+    """TTL + LRU кэш ответов LLM со статистикой попаданий по эндпоинтам."""
+
+    def __init__(
+        self,
+        max_size: int = llm_cache_size,
+        ttl: float = llm_cache_ttl,
+        endpoints: Iterable[str] = llm_cache_endpoints,
+        version_paths: Iterable[Path] = (),
+        version_check_interval: float = 5.0
+    ):
+        """
+        Args:
+            max_size: Максимальное число записей
+            ttl: Время жизни записи в секундах
+            endpoints: Эндпоинты, которые включили кэш (opt-in)
+            version_paths: Файлы, изменение которых сбрасывает кэш
+            version_check_interval: Как часто (секунды) проверять версию файлов
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.endpoints = set(endpoints)
+        self.version_paths = [Path(path) for path in version_paths]
+        self.version_check_interval = version_check_interval
+
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._version: Optional[Tuple] = None
+        self._version_checked_at = 0.0
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self.evictions = 0
+        self.invalidations = 0
+
+    def enabled_for(self, endpoint: Optional[str]) -> bool:
+        """Включён ли кэш для эндпоинта."""
+        return endpoint is not None and endpoint in self.endpoints and self.max_size > 0
+
+    @staticmethod
+    def make_key(prompt: str, model_name: str, params: Dict[str, Any]) -> str:
+        """Ключ записи: sha256 от промпта, модели и параметров сэмплирования."""
+        raw = json.dumps(
+            {"prompt": prompt, "model": model_name, "params": params},
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _content_version(self) -> Tuple:
+        """Версия контента - mtime и размер отслеживаемых файлов."""
+        version = []
+        for path in self.version_paths:
+            try:
+                stat = os.stat(path)
+                version.append((str(path), stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                version.append((str(path), None, None))
+        return tuple(version)
+
+    def _check_version(self):
+        """Сбрасывает кэш, если контент изменился (не чаще version_check_interval)."""
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+
+        version = self._content_version()
+        if self._version is not None and version != self._version:
+            self._entries.clear()
+            self.invalidations += 1
+        self._version = version
+
+    def _endpoint_stats(self, endpoint: str) -> Dict[str, int]:
+        return self._stats.setdefault(endpoint, {"hits": 0, "misses": 0})
+
+    def get(self, key: str, endpoint: str) -> Optional[str]:
+        """Возвращает ответ из кэша или None, учитывая попадание/промах."""
+        self._check_version()
+        stats = self._endpoint_stats(endpoint)
+
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        stats["hits"] += 1
+        return entry[1]
+
+    def set(self, key: str, value: str):
+        """Сохраняет ответ, вытесняя самые старые записи при переполнении."""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Полностью очищает кэш."""
+        self._entries.clear()
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Размер, вытеснения, сбросы и hit rate по эндпоинтам."""
+        endpoints = {}
+        for endpoint, stats in self._stats.items():
+            total = stats["hits"] + stats["misses"]
+            endpoints[endpoint] = {
+                **stats,
+                "hit_rate": round(stats["hits"] / total, 4) if total else 0.0
+            }
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "enabled_endpoints": sorted(self.endpoints),
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "endpoints": endpoints
+        }
+
+
+def _version_paths() -> List[Path]:
+    vector_store = Path(rag_vector_store_dir)
+    return [
+        vector_store / "faiss_index.bin",
+        vector_store / "metadata.pkl",
+        vector_store / "index_info.json",
+        QUIZ_JSON_PATH,
+    ]
+
+
+# Общий кэш на процесс
+llm_cache = LLMResponseCache(version_paths=_version_paths())
@@ -0,0 +1,118 @@
+"""
+Локальная оценка калибровочного теста.
+
+Каждый вариант ответа калибровочного теста (tests[0]) имеет вес "w".
+Сумма весов выбранных вариантов переводится в число пропускаемых модулей
+по тем же критериям, что были в промпте для LLM:
+
+- Новичок (0-3): не пропускать модули
+- Начальный уровень (4-7): 1-2 базовых модуля
+- Средний уровень (8-11): 3-4 модуля
+- Опытный (12+): 5-6 модулей
+
+Модули пропускаются по порядку, начиная с базовых; модуль 0 не
+пропускается никогда, минимум 4 модуля остаются.
+
+Оценщик строится вместе со снимком контента (models/content.py).
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+MIN_REMAINING_MODULES = 4
+
+# (минимальный балл, уровень, сколько модулей пропустить) - по убыванию балла
+SCORE_BANDS: List[Tuple[int, str, int]] = [
+    (13, "Опытный", 6),
+    (12, "Опытный", 5),
+    (10, "Средний уровень", 4),
+    (8, "Средний уровень", 3),
+    (6, "Начальный уровень", 2),
+    (4, "Начальный уровень", 1),
+    (0, "Новичок", 0),
+]
+
+_QUESTION_KEY = re.compile(r"^question(\d+)$")
+
+
+@dataclass(frozen=True)
+class CalibrationResult:
+    score: int
+    max_score: int
+    level: str
+    skipped_modules: List[int]
+    message: str
+
+
+def skip_band(score: int) -> Tuple[str, int]:
+    """Уровень и число пропускаемых модулей для балла."""
+    for min_score, level, skip in SCORE_BANDS:
+        if score >= min_score:
+            return level, skip
+    return SCORE_BANDS[-1][1], 0
+
+
+class CalibrationScorer:
+    """Таблицы весов калибровочного теста, построенные один раз на версию quiz.json."""
+
+    def __init__(self, questions: List[Dict], test_names: Dict):
+        # Номер вопроса -> {текст варианта: вес}
+        self._weights: List[Dict[str, int]] = []
+        self._by_text: Dict[str, int] = {}
+        for index, question in enumerate(questions):
+            options = question.get("o", [])
+            weights = question.get("w", [0] * len(options))
+            self._weights.append({
+                _normalize(option): int(weight) for option, weight in zip(options, weights)
+            })
+            self._by_text[_normalize(question.get("q", ""))] = index
+
+        self.max_score = sum(max(weights.values(), default=0) for weights in self._weights)
+        self.test_names = {int(module_id): name for module_id, name in test_names.items()}
+        # Порядок пропуска: сначала базовые модули, калибровочный (0) исключён
+        self.module_order = sorted(module_id for module_id in self.test_names if module_id != 0)
+
+    def _question_index(self, key: str) -> Optional[int]:
+        """Ключ ответа - "questionN" (как шлёт фронтенд) или текст вопроса."""
+        match = _QUESTION_KEY.match(key.strip())
+        if match:
+            index = int(match.group(1)) - 1
+            return index if 0 <= index < len(self._weights) else None
+        return self._by_text.get(_normalize(key))
+
+    def score(self, answers: Dict[str, str]) -> int:
+        """Сумма весов выбранных вариантов; неизвестные ответы дают 0."""
+        total = 0
+        for key, answer in answers.items():
+            index = self._question_index(key)
+            if index is not None:
+                total += self._weights[index].get(_normalize(answer), 0)
+        return total
+
+    def evaluate(self, answers: Dict[str, str]) -> CalibrationResult:
+        score = self.score(answers)
+        level, skip = skip_band(score)
+
+        max_skip = max(len(self.module_order) - MIN_REMAINING_MODULES, 0)
+        skipped_modules = self.module_order[:min(skip, max_skip)]
+
+        return CalibrationResult(
+            score=score,
+            max_score=self.max_score,
+            level=level,
+            skipped_modules=skipped_modules,
+            message=self._message(score, level, skipped_modules)
+        )
+
+    def _message(self, score: int, level: str, skipped_modules: List[int]) -> str:
+        prefix = f"{level}: {score} из {self.max_score} баллов калибровочного теста."
+        if not skipped_modules:
+            return f"{prefix} Рекомендуем пройти все модули для полноценного обучения"
+        names = ", ".join(f"«{self.test_names[module_id]}»" for module_id in skipped_modules)
+        return f"{prefix} Можно пропустить базовые модули: {names}"
+
+
+def _normalize(text: str) -> str:
+    return " ".join(str(text).split()).casefold()
+
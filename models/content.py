@@ -0,0 +1,270 @@
+"""
+Репозиторий учебного контента в памяти.
+
+quiz.json (названия модулей и текущие версии тестов), краткие содержания
+модулей из CONTENT_SUMMARY_DIR и таблицы оценки калибровочного теста
+загружаются один раз в неизменяемый снимок, вместе с готовыми (сериализованными
+и сжатыми) ответами /get_module. Перед выдачей снимка не чаще
+CONTENT_CHECK_INTERVAL секунд сверяются номер версии quiz.json (маленький
+файл рядом, который увеличивает каждая запись) и mtime, размер и inode файлов -
+JSON при этом не разбирается. Если они изменились, собирается новый снимок и подменяет старый одним присваиванием -
+обработчики, уже взявшие снимок, дорабатывают со своей версией. Если новый
+quiz.json не читается (например, записан наполовину), остаётся прежний снимок.
+
+У модуля может быть несколько версий вопросов. Пользователь получает версию по
+стабильному хэшу (user_id, module_id) - одну и ту же при каждом запросе, без
+записи в файлы или БД; запросы без user_id получают версию по умолчанию
+(current_version в quiz.json). Ответ с вопросами несёт номер версии
+("variant", null - версия по умолчанию): клиент возвращает его в /submit_module,
+и ответы проверяются по тем вопросам, которые он действительно показал.
+
+Каталог модулей (/modules) тоже сериализуется при сборке снимка; наборы
+модулей с вопросами собираются при первом запросе и кэшируются в снимке.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from config import content_summary_dir, content_check_interval
+from models.calibration import CalibrationScorer
+from models.http_cache import EncodedBody, encode_json
+from quiz import QUIZ_JSON_PATH, QUIZ_VERSION_PATH, parse_quiz_data, parse_quiz_variants
+
+# Сколько собранных наборов модулей (/modules?include=) хранить на снимок
+BUNDLE_CACHE_SIZE = 64
+
+# Файл краткого содержания модуля начинается с его номера: "3_технологии.txt"
+_SUMMARY_NAME = re.compile(r"^(\d+)")
+
+
+@dataclass(frozen=True)
+class ContentSnapshot:
+    """Версия контента. Не изменяется после сборки - словари только для чтения."""
+
+    version: Tuple
+    quiz_version: int
+    test_names: Mapping[int, str]
+    tests: Mapping[int, List[Dict[str, Any]]]
+    summaries: Mapping[int, str]
+    variants: Mapping[int, Tuple[List[Dict[str, Any]], ...]]
+    scorer: CalibrationScorer
+    module_responses: Mapping[int, EncodedBody]
+    variant_responses: Mapping[int, Tuple[EncodedBody, ...]]
+    catalogue: Tuple[Dict[str, Any], ...]
+    catalogue_response: EncodedBody
+    loaded_at: float
+    # Кэш собранных наборов модулей - производные данные снимка, не его состояние
+    _bundles: "OrderedDict[Tuple, EncodedBody]" = field(default_factory=OrderedDict, compare=False, repr=False)
+
+    def module_ids(self) -> List[int]:
+        """Номера учебных модулей без калибровочного теста."""
+        return sorted(module_id for module_id in self.tests if module_id != 0)
+
+    def module_name(self, module_id: int) -> str:
+        return self.test_names.get(module_id, f"Модуль {module_id}")
+
+    def variant_index(self, module_id: int, user_id: Optional[int]) -> Optional[int]:
+        """Версия вопросов модуля для пользователя или None - версия по умолчанию."""
+        variants = self.variants.get(module_id, ())
+        # Калибровочный тест всегда один - по нему считаются баллы
+        if user_id is None or module_id == 0 or len(variants) < 2:
+            return None
+        digest = hashlib.blake2b(f"{user_id}:{module_id}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % len(variants)
+
+    def questions(self, module_id: int, variant: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """Вопросы версии variant модуля (None - версия по умолчанию); None - нет такой версии."""
+        if variant is None:
+            return self.tests[module_id]
+        variants = self.variants.get(module_id, ())
+        return variants[variant] if 0 <= variant < len(variants) else None
+
+    def module_response(self, module_id: int, user_id: Optional[int] = None) -> Optional[EncodedBody]:
+        """Готовый ответ /get_module в версии пользователя; None - нет модуля."""
+        index = self.variant_index(module_id, user_id)
+        if index is None:
+            return self.module_responses.get(module_id)
+        return self.variant_responses[module_id][index]
+
+    def bundle_response(self, module_ids: Iterable[int], user_id: Optional[int] = None) -> EncodedBody:
+        """
+        Каталог модулей и вопросы выбранных модулей (в версиях пользователя)
+        одним ответом. Модули должны существовать в снимке.
+        """
+        key = tuple((module_id, self.variant_index(module_id, user_id)) for module_id in sorted(set(module_ids)))
+        if not key:
+            return self.catalogue_response
+
+        body = self._bundles.get(key)
+        if body is None:
+            body = encode_json({
+                "modules": self.catalogue,
+                "questions": {str(module_id): self.questions(module_id, index) for module_id, index in key},
+                "variants": {str(module_id): index for module_id, index in key}
+            })
+            self._bundles[key] = body
+            while len(self._bundles) > BUNDLE_CACHE_SIZE:
+                self._bundles.popitem(last=False)
+        else:
+            self._bundles.move_to_end(key)
+        return body
+
+    def summary(self, module_id: int) -> str:
+        """Краткое содержание модуля (контекст для генерации викторин)."""
+        try:
+            return self.summaries[int(module_id)]
+        except (KeyError, ValueError):
+            raise FileNotFoundError(f"Нет краткого содержания модуля {module_id}") from None
+
+
+def _summary_files(summary_dir: Path) -> Dict[int, Path]:
+    files = {}
+    try:
+        names = sorted(os.listdir(summary_dir))
+    except OSError:
+        return files
+    for name in names:
+        match = _SUMMARY_NAME.match(name)
+        if match:
+            files.setdefault(int(match.group(1)), summary_dir / name)
+    return files
+
+
+class ContentRepository:
+    """Хранит текущий снимок контента и подменяет его при изменении файлов."""
+
+    def __init__(
+        self,
+        quiz_path: Path = QUIZ_JSON_PATH,
+        version_path: Path = QUIZ_VERSION_PATH,
+        summary_dir: str = content_summary_dir,
+        check_interval: float = content_check_interval
+    ):
+        self.quiz_path = Path(quiz_path)
+        self.version_path = Path(version_path)
+        self.summary_dir = Path(summary_dir)
+        self.check_interval = check_interval
+
+        self._snapshot: Optional[ContentSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.reload_failures = 0
+
+    def _version(self) -> Tuple:
+        """mtime, размер и inode файла версии, quiz.json, каталога кратких содержаний и его файлов."""
+        paths = [self.version_path, self.quiz_path, self.summary_dir] + list(_summary_files(self.summary_dir).values())
+        version = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                version.append((str(path), stat.st_mtime_ns, stat.st_size, stat.st_ino))
+            except OSError:
+                version.append((str(path), None, None, None))
+        return tuple(version)
+
+    def _load(self, version: Tuple) -> ContentSnapshot:
+        with open(self.quiz_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        test_names_raw, tests = parse_quiz_data(data)
+        variants = {module_id: tuple(versions) for module_id, versions in parse_quiz_variants(data).items()}
+        test_names = {int(module_id): name for module_id, name in test_names_raw.items()}
+
+        summaries = {}
+        for module_id, path in _summary_files(self.summary_dir).items():
+            with open(path, "r", encoding="utf-8") as f:
+                summaries[module_id] = f.read()
+
+        def encode_module(module_id, questions, variant=None):
+            return encode_json({
+                "module_id": module_id,
+                "module_name": test_names.get(module_id, f"Модуль {module_id}"),
+                "questions": questions,
+                "total_questions": len(questions),
+                "variant": variant
+            })
+
+        module_responses = {module_id: encode_module(module_id, questions) for module_id, questions in tests.items()}
+        variant_responses = {
+            module_id: tuple(encode_module(module_id, questions, index) for index, questions in enumerate(versions))
+            for module_id, versions in variants.items() if len(versions) > 1
+        }
+        catalogue = tuple(
+            {
+                "module_id": module_id,
+                "module_name": test_names.get(module_id, f"Модуль {module_id}"),
+                "total_questions": len(questions)
+            }
+            for module_id, questions in sorted(tests.items())
+        )
+
+        return ContentSnapshot(
+            version=version,
+            quiz_version=int(data.get("version", 0)),
+            test_names=MappingProxyType(test_names),
+            tests=MappingProxyType(tests),
+            summaries=MappingProxyType(summaries),
+            variants=MappingProxyType(variants),
+            scorer=CalibrationScorer(tests.get(0, []), test_names),
+            module_responses=MappingProxyType(module_responses),
+            variant_responses=MappingProxyType(variant_responses),
+            catalogue=catalogue,
+            catalogue_response=encode_json({"modules": catalogue}),
+            loaded_at=time.time()
+        )
+
+    def reload(self, force: bool = False) -> ContentSnapshot:
+        """Пересобирает снимок, если файлы изменились (или force)."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            version = self._version()
+            current = self._snapshot
+            if current is not None and not force and version == current.version:
+                return current
+
+            try:
+                snapshot = self._load(version)
+            except Exception as e:
+                if current is None:
+                    raise
+                self.reload_failures += 1
+                logging.warning(f"Контент не перезагружен, остаётся прежняя версия: {e}")
+                return current
+
+            self._snapshot = snapshot
+            self.reloads += 1
+            if current is not None:
+                logging.info("Контент перезагружен", extra={"modules": len(snapshot.tests)})
+            return snapshot
+
+    def snapshot(self) -> ContentSnapshot:
+        """Текущий снимок; файлы проверяются не чаще check_interval."""
+        current = self._snapshot
+        if current is None or time.monotonic() - self._checked_at >= self.check_interval:
+            return self.reload()
+        return current
+
+    def stats(self) -> Dict[str, Any]:
+        current = self._snapshot
+        return {
+            "quiz_version": current.quiz_version if current else None,
+            "loaded_at": current.loaded_at if current else None,
+            "modules": len(current.tests) if current else 0,
+            "summaries": len(current.summaries) if current else 0,
+            "reloads": self.reloads,
+            "reload_failures": self.reload_failures
+        }
+
+
+# Общий репозиторий на процесс
+content = ContentRepository()
@@ -0,0 +1,116 @@
+"""
+Готовые к отдаче JSON ответы для редко меняющегося контента.
+
+Тело сериализуется и сжимается (gzip, brotli - если установлен пакет brotli)
+один раз при сборке снимка контента. Обработчик выбирает вариант по
+Accept-Encoding и отвечает 304 на If-None-Match с текущим ETag, не трогая
+ни сериализацию, ни сжатие.
+"""
+
+import gzip
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+@dataclass(frozen=True)
+class EncodedBody:
+    """Тело ответа в исходном и сжатых вариантах со строгим ETag."""
+
+    identity: bytes
+    gzip: bytes
+    br: Optional[bytes]
+    etag: str
+
+    def variant(self, encoding: str) -> bytes:
+        return {"br": self.br, "gzip": self.gzip}.get(encoding) or self.identity
+
+    def etag_for(self, encoding: str) -> str:
+        # Строгий ETag относится к конкретному представлению, поэтому у сжатых вариантов свой суффикс
+        if encoding == "identity":
+            return f'"{self.etag}"'
+        return f'"{self.etag}-{encoding}"'
+
+
+def encode_json(payload: Any) -> EncodedBody:
+    """Сериализует payload и готовит сжатые варианты."""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return EncodedBody(
+        identity=body,
+        gzip=gzip.compress(body, compresslevel=9, mtime=0),
+        br=brotli.compress(body, quality=11) if brotli is not None else None,
+        etag=hashlib.sha256(body).hexdigest()[:32]
+    )
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding -> {кодировка: q}."""
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def choose_encoding(body: EncodedBody, accept_encoding: str) -> str:
+    accepted = _accepted_encodings(accept_encoding or "")
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = "identity", 0.0
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and body.br is None:
+            continue
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _not_modified(body: EncodedBody, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Для If-None-Match достаточно слабого сравнения: W/ и суффикс кодировки не важны
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag.split("-", 1)[0] == body.etag:
+            return True
+    return False
+
+
+def cached_json_response(request: Request, body: EncodedBody, cache_control: str) -> Response:
+    """Ответ из заранее подготовленного тела: 304 или сжатый по Accept-Encoding вариант."""
+    encoding = choose_encoding(body, request.headers.get("accept-encoding", ""))
+    headers = {
+        "ETag": body.etag_for(encoding),
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+
+    if _not_modified(body, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body.variant(encoding), media_type="application/json", headers=headers)
@@ -0,0 +1,276 @@
+"""
+Извлечение, починка и проверка JSON из ответов LLM.
+
+Ответ модели часто почти валиден: JSON обёрнут в ```json и пояснения, после
+последнего элемента стоит лишняя запятая, или генерация упёрлась в max_tokens
+посреди последнего вопроса. Выбрасывать из-за этого многосекундную генерацию
+дорого, поэтому parse_model:
+
+1. вырезает JSON из текста (от первой { или [ до парной закрывающей);
+2. убирает висячие запятые;
+3. если JSON оборван - обрезает его по последнему законченному значению и
+   закрывает открытые скобки;
+4. проверяет результат pydantic моделью; элементы списков, не прошедшие
+   проверку (например, недописанный последний вопрос), отбрасываются.
+
+Только если так ничего не получилось, parse_with_retry один раз просит LLM
+исправить ответ коротким промптом. Итоги разбора по эндпоинтам - в parse_stats.
+"""
+
+import json
+import logging
+import typing
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+from models.metrics import stage_timer
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+# Сколько символов исходного ответа показывать LLM в промпте починки
+REPAIR_MAX_CHARS = 6000
+
+repair_prompt_template = """Исправь ответ так, чтобы он был одним валидным JSON объектом по схеме.
+Не меняй содержание, не добавляй пояснений и markdown - выведи только JSON.
+
+Схема:
+{schema}
+
+Ответ для исправления:
+{text}
+"""
+
+
+class JsonParseError(ValueError):
+    """Из ответа LLM не удалось получить объект, проходящий проверку."""
+
+
+def _scan(text: str, start: int) -> Tuple[str, bool]:
+    """
+    Проходит JSON значение от text[start], выкидывая висячие запятые.
+
+    Returns:
+        (починенный JSON, был ли он оборван)
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    # Последняя точка, где значение внутри контейнера закончилось: (длина out, стек)
+    safe: Optional[Tuple[int, Tuple[str, ...]]] = None
+    in_string = escape = False
+
+    for char in text[start:]:
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+                if stack and stack[-1] == "[":
+                    safe = (len(out), tuple(stack))
+            continue
+
+        if char == '"':
+            in_string = True
+            out.append(char)
+        elif char in _CLOSERS:
+            stack.append(char)
+            out.append(char)
+        elif char in "}]":
+            if not stack or _CLOSERS[stack[-1]] != char:
+                # Лишняя закрывающая скобка - дальше уже не JSON
+                break
+            _drop_trailing_comma(out)
+            stack.pop()
+            out.append(char)
+            if not stack:
+                return "".join(out), False
+            safe = (len(out), tuple(stack))
+        elif char == "," and stack:
+            # Запятая завершает элемент массива или пару ключ-значение
+            safe = (len(out), tuple(stack))
+            out.append(char)
+        else:
+            out.append(char)
+
+    # Текст кончился внутри значения: обрезаем по последнему законченному значению
+    if safe is None:
+        raise JsonParseError("JSON оборван до первого законченного значения")
+    length, open_stack = safe
+    del out[length:]
+    _drop_trailing_comma(out)
+    out.extend(_CLOSERS[opener] for opener in reversed(open_stack))
+    return "".join(out), True
+
+
+def _drop_trailing_comma(out: List[str]):
+    """Убирает запятую (и пробелы после неё) в конце out."""
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i:]
+
+
+def repair_json(text: str) -> Tuple[Any, bool]:
+    """
+    Достаёт JSON из ответа LLM и чинит его.
+
+    Returns:
+        (разобранное значение, был ли JSON оборван)
+
+    Raises:
+        JsonParseError: JSON в тексте не найден или не чинится
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        raise JsonParseError("В ответе нет JSON")
+
+    repaired, truncated = _scan(text, min(starts))
+    try:
+        return json.loads(repaired), truncated
+    except json.JSONDecodeError as e:
+        raise JsonParseError(f"JSON не удалось починить: {e}") from e
+
+
+def _list_item_model(annotation) -> Optional[Type[BaseModel]]:
+    """Модель элемента для полей вида List[Model]."""
+    if typing.get_origin(annotation) in (list, List):
+        args = typing.get_args(annotation)
+        if args and isinstance(args[0], type) and issubclass(args[0], BaseModel):
+            return args[0]
+    return None
+
+
+def _drop_invalid_items(model: Type[BaseModel], data: Any) -> Tuple[Any, int]:
+    """Отбрасывает элементы List[Model] полей, не прошедшие проверку."""
+    if not isinstance(data, dict):
+        return data, 0
+    dropped = 0
+    data = dict(data)
+    for name, field in model.model_fields.items():
+        item_model = _list_item_model(field.annotation)
+        key = field.alias or name
+        if item_model is None or not isinstance(data.get(key), list):
+            continue
+        valid = []
+        for item in data[key]:
+            try:
+                valid.append(item_model.model_validate(item))
+            except ValidationError:
+                dropped += 1
+        data[key] = valid
+    return data, dropped
+
+
+def parse_model(text: str, model: Type[BaseModel]) -> Tuple[BaseModel, str]:
+    """
+    Разбирает ответ LLM в pydantic модель.
+
+    Returns:
+        (модель, итог: "ok" - валиден как есть, "repaired" - починен синтаксис,
+        "recovered" - оборван или отброшены невалидные элементы)
+
+    Raises:
+        JsonParseError: Ответ не удалось разобрать
+    """
+    try:
+        return model.model_validate_json(text.strip()), "ok"
+    except ValidationError:
+        pass
+
+    data, truncated = repair_json(text)
+    try:
+        return model.model_validate(data), "recovered" if truncated else "repaired"
+    except ValidationError as e:
+        error = e
+
+    data, dropped = _drop_invalid_items(model, data)
+    if dropped:
+        try:
+            return model.model_validate(data), "recovered"
+        except ValidationError as e:
+            error = e
+    raise JsonParseError(f"Ответ не прошёл проверку схемы: {error.error_count()} ошибок") from error
+
+
+class ParseStats:
+    """Итоги разбора ответов LLM по эндпоинтам."""
+
+    RESULTS = ("ok", "repaired", "recovered", "retried", "failed")
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, endpoint: str, result: str):
+        counts = self._counts.setdefault(endpoint, dict.fromkeys(self.RESULTS, 0))
+        counts[result] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        result = {}
+        for endpoint, counts in self._counts.items():
+            total = sum(counts.values())
+            result[endpoint] = {
+                **counts,
+                "total": total,
+                # Доля ответов, которые не удалось разобрать даже после починки
+                "parse_failure_rate": round(counts["failed"] / total, 4) if total else 0.0,
+                # Доля ответов, для которых понадобился повторный запрос к LLM
+                "retry_rate": round((counts["retried"] + counts["failed"]) / total, 4) if total else 0.0
+            }
+        return result
+
+
+parse_stats = ParseStats()
+
+
+def _parse_converted(text: str, model: Type[BaseModel], convert: Optional[Callable[[BaseModel], Any]]):
+    with stage_timer("json_parse"):
+        parsed, result = parse_model(text, model)
+        return (convert(parsed) if convert is not None else parsed), result
+
+
+async def parse_with_retry(
+    text: str,
+    model: Type[BaseModel],
+    predict: Callable[[str], Awaitable[str]],
+    endpoint: str,
+    convert: Optional[Callable[[BaseModel], Any]] = None
+) -> Any:
+    """
+    parse_model, а при неудаче - один повторный запрос к LLM с промптом починки.
+
+    Args:
+        text: Ответ LLM
+        model: Ожидаемая pydantic модель
+        predict: Вызов LLM для промпта починки
+        endpoint: Эндпоинт для статистики
+        convert: Преобразует модель в результат; ValueError - ответ не годится
+
+    Returns:
+        Результат convert (или модель, если convert не задан)
+
+    Raises:
+        JsonParseError: Ответ не удалось разобрать и после починки
+    """
+    try:
+        value, result = _parse_converted(text, model, convert)
+        parse_stats.record(endpoint, result)
+        return value
+    except ValueError as e:
+        logging.warning(f"Ответ LLM ({endpoint}) не разобран, повторный запрос на починку: {e}")
+
+    prompt = repair_prompt_template.format(
+        schema=json.dumps(model.model_json_schema(), ensure_ascii=False),
+        text=text[:REPAIR_MAX_CHARS]
+    )
+    repaired_text = await predict(prompt)
+    try:
+        value, _ = _parse_converted(repaired_text, model, convert)
+    except ValueError as e:
+        parse_stats.record(endpoint, "failed")
+        raise JsonParseError(f"Ответ LLM не разобран и после починки: {e}") from e
+    parse_stats.record(endpoint, "retried")
+    return value
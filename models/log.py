@@ -0,0 +1,143 @@
+"""
+Структурированные логи в JSON lines без блокировки цикла событий.
+
+Обработчики вызывают logging как обычно; корневой логгер пишет записи в
+очередь (QueueHandler), а в файл/stdout их выводит фоновый поток
+(QueueListener). Каждая запись - одна JSON строка с уровнем, логгером,
+сообщением, trace_id текущей трассы и полями из extra.
+
+Тела промптов и ответов LLM пишутся только для доли запросов
+LOG_PROMPT_SAMPLE_RATE и обрезаются до LOG_FIELD_MAX_CHARS; в остальных
+записях от них остаются длина и хэш.
+"""
+
+import atexit
+import copy
+import hashlib
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from typing import Any, Dict, Optional
+
+from config import (
+    log_level,
+    log_file,
+    log_prompt_sample_rate,
+    log_field_max_chars,
+)
+from models.tracing import current_trace_id
+
+# Атрибуты LogRecord, которые не относятся к extra
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "trace_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+llm_logger = logging.getLogger("bezbot.llm")
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога -> одна JSON строка."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            data["trace_id"] = trace_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Готовит запись к передаче в фоновый поток, сохраняя исключение отдельным полем."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        # В фоновом потоке контекста трассы уже нет
+        record.trace_id = current_trace_id()
+        return record
+
+
+def setup_logging():
+    """Переключает корневой логгер на очередь с фоновой записью (вызывается один раз)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(log_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает оставшиеся записи и останавливает фоновый поток."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def compact(text: Any, sampled: bool = False, max_chars: int = log_field_max_chars) -> Dict[str, Any]:
+    """
+    Тяжёлое поле для лога: длина и хэш, а если sampled - ещё и текст,
+    обрезанный до max_chars.
+    """
+    text = text if isinstance(text, str) else json.dumps(text, ensure_ascii=False, default=str)
+    field = {
+        "len": len(text),
+        "sha256": hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    }
+    if sampled:
+        field["text"] = text if len(text) <= max_chars else text[:max_chars] + "…"
+    return field
+
+
+def log_llm_exchange(endpoint: str, prompt: Any, answer: Any, **extra: Any):
+    """Промпт и ответ LLM: тела - только для сэмплированной доли запросов."""
+    if not llm_logger.isEnabledFor(logging.INFO):
+        return
+    sampled = random.random() < log_prompt_sample_rate
+    llm_logger.info(
+        f"LLM exchange {endpoint}",
+        extra={
+            "endpoint": endpoint,
+            "prompt": compact(prompt, sampled),
+            "answer": compact(answer, sampled),
+            "sampled": sampled,
+            **extra
+        }
+    )
@@ -0,0 +1,214 @@
+"""
+Метрики API в текстовом формате Prometheus (GET /metrics).
+
+Без внешних зависимостей: счётчики, gauge и гистограммы с метками хранятся
+в памяти процесса. stage_timer замеряет отдельные этапы обработки (RAG,
+LLM, разбор JSON, запросы к БД, ffmpeg и распознавание речи) и считает их
+ошибки по типу исключения. Статистика кэша, токенов, автомата и допуска
+подключается через register_collector и снимается в момент запроса /metrics.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from models.tracing import span
+
+# Границы гистограмм задержек, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Общая часть метрик: имя, описание, метки и блокировка."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # метки -> (счётчики по корзинам, сумма, количество)
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# Снимок внешней статистики: (имя, тип, описание, [(метки, значение)])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class Registry:
+    """Набор метрик процесса и коллекторов внешней статистики."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+
+        for collector in self._collectors:
+            for name, metric_type, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests_total = registry.register(Counter(
+    "bezbot_http_requests_total", "Обработанные HTTP запросы", ("route", "method", "status")
+))
+http_request_duration = registry.register(Histogram(
+    "bezbot_http_request_duration_seconds", "Время обработки HTTP запроса до ответа", ("route", "method")
+))
+http_in_flight = registry.register(Gauge(
+    "bezbot_http_requests_in_flight", "HTTP запросы в обработке", ("route",)
+))
+stage_duration = registry.register(Histogram(
+    "bezbot_stage_duration_seconds", "Время этапов обработки (rag, llm, json_parse, db, ffmpeg, stt)", ("stage",)
+))
+stage_in_flight = registry.register(Gauge(
+    "bezbot_stage_in_flight", "Этапы обработки в работе", ("stage",)
+))
+errors_total = registry.register(Counter(
+    "bezbot_errors_total", "Ошибки по месту возникновения и типу исключения", ("where", "type")
+))
+
+
+def record_error(where: str, error: BaseException):
+    """Учитывает ошибку по типу исключения."""
+    errors_total.inc(where=where, type=type(error).__name__)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """
+    Замеряет этап обработки. Работает и в async коде: `with stage_timer("rag"): await ...`.
+
+    Исключение из блока учитывается в bezbot_errors_total{where=stage}.
+    Этап также попадает в трассу запроса отдельным спаном.
+    """
+    stage_in_flight.inc(stage=stage)
+    started = time.perf_counter()
+    try:
+        with span(stage):
+            yield
+    except Exception as e:
+        record_error(stage, e)
+        raise
+    finally:
+        stage_duration.observe(time.perf_counter() - started, stage=stage)
+        stage_in_flight.dec(stage=stage)
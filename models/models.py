@@ -2,10 +2,84 @@ from langchain_core.language_models.llms import BaseLLM
 from langchain_core.callbacks.manager import CallbackManagerForLLMRun
 from langchain_core.outputs import LLMResult, Generation
 from pydantic import Field
-from typing import Any, List, Optional
+from typing import Any, AsyncIterator, ContextManager, Dict, List, Optional, Sequence
+from contextlib import nullcontext
+import asyncio
+import json
+import logging
+import time
 import requests
+import httpx
 
-from config import model_url, model_name
+from config import (
+    model_url,
+    model_urls,
+    model_name,
+    llm_pool_size,
+    llm_connect_timeout,
+    llm_read_timeout,
+)
+from models.cache import llm_cache
+from models.tokens import estimate_tokens, get_budget, apply_stop, StopFilter, token_meter
+from models.resilience import CircuitBreaker, LatencyTracker, LLMUnavailableError, hedged
+from models.balancer import LLMBalancer
+from models.metrics import stage_timer
+from models.tracing import span, inject_headers
+
+
+# Общий на процесс keep-alive клиент к LLM бэкенду
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Возвращает общий пул соединений к LLM (создаётся при первом вызове)"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=llm_pool_size,
+                max_keepalive_connections=llm_pool_size
+            ),
+            timeout=httpx.Timeout(llm_read_timeout, connect=llm_connect_timeout)
+        )
+    return _http_client
+
+
+# Автомат и задержки по эндпоинтам общие на процесс
+llm_breaker = CircuitBreaker()
+llm_latency: Dict[str, LatencyTracker] = {}
+
+
+def get_latency_tracker(endpoint: Optional[str]) -> LatencyTracker:
+    return llm_latency.setdefault(endpoint or "other", LatencyTracker())
+
+
+class LLMBackendError(Exception):
+    """Бэкенд ответил статусом, отличным от 200"""
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"YandexGPT API error: {status_code} — {text}")
+        self.status_code = status_code
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """Сбой, который считается автоматом: таймаут, сеть или 5xx"""
+    if isinstance(error, LLMBackendError):
+        return error.status_code >= 500
+    return isinstance(error, (httpx.TransportError, requests.ConnectionError, requests.Timeout))
+
+
+def is_failover_error(error: BaseException) -> bool:
+    """Сбой реплики, после которого запрос можно повторить на другой (кроме истёкшего ожидания ответа)"""
+    return is_backend_failure(error) and not isinstance(error, (httpx.ReadTimeout, requests.ReadTimeout))
+
+
+async def close_http_client():
+    """Закрывает общий пул соединений (при остановке приложения)"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
 
 
 class YandexGPTLangChain(BaseLLM):
@@ -13,6 +87,55 @@ class YandexGPTLangChain(BaseLLM):
     
     api_url: str = Field(default=model_url)
     model_name: str = Field(default=model_name)
+    # Если задан, запросы распределяются по репликам, api_url не используется
+    balancer: Optional[Any] = Field(default=None, exclude=True)
+
+    def _route(self, tried: Sequence[str] = ()) -> ContextManager[str]:
+        """URL бэкенда на время одного запроса (tried - реплики, которые уже пробовали)"""
+        if self.balancer is None:
+            return nullcontext(self.api_url)
+        return self.balancer.route(is_backend_failure, exclude=tried)
+
+    def _failover(self, error: BaseException, tried: Sequence[str]) -> bool:
+        """Повторить ли запрос на другой реплике: один раз и только если есть здоровая непробованная"""
+        if self.balancer is None or len(tried) != 1 or not is_failover_error(error):
+            return False
+        if not self.balancer.alternative(tried):
+            return False
+        self.balancer.record_failover(tried[0])
+        logging.warning(f"Реплика LLM {tried[0]} не ответила ({error!r}), повтор на другой реплике")
+        return True
+
+    def _build_payload(
+        self,
+        prompt: str,
+        endpoint: Optional[str] = None,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> dict:
+        """Тело запроса к /chat: max_tokens и stop по умолчанию берутся из бюджета эндпоинта"""
+        budget = get_budget(endpoint)
+        payload = {
+            "prompt": prompt,
+            "max_tokens": kwargs.get("max_tokens", budget.max_tokens),
+            "temperature": kwargs.get("temperature", 0.7),
+            "top_p": kwargs.get("top_p", 0.9)
+        }
+        stop = stop if stop is not None else budget.stop
+        if stop:
+            payload["stop"] = list(stop)
+        return payload
+
+    def _record_tokens(self, endpoint: Optional[str], payload: dict, text: str, usage: Optional[dict] = None):
+        """Учитывает prompt/completion токены запроса (из usage бэкенда или по оценке)"""
+        usage = usage or {}
+        prompt_tokens = usage.get("prompt_tokens") or estimate_tokens(payload["prompt"])
+        completion_tokens = usage.get("completion_tokens") or estimate_tokens(text)
+        token_meter.record(endpoint, prompt_tokens, completion_tokens, payload["max_tokens"])
+        logging.info(
+            f"LLM {endpoint or '-'}: prompt {prompt_tokens}, completion {completion_tokens} "
+            f"токенов (лимит {payload['max_tokens']})"
+        )
 
     def predict(
         self,
@@ -21,30 +144,205 @@ class YandexGPTLangChain(BaseLLM):
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> str:
-        """Вызов YandexGPT API"""
+        """Синхронный вызов YandexGPT API (для скриптов вне цикла событий)"""
         try:
-            payload = {
-                "prompt": prompt,
-                "max_tokens": kwargs.get("max_tokens", 120000),
-                "temperature": kwargs.get("temperature", 0.7),
-                "top_p": kwargs.get("top_p", 0.9)
-            }
-
-            response = requests.post(
-                f"{self.api_url}/chat",
-                json=payload,
-                timeout=60
-            )
-
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("response", "")
-            else:
-                raise Exception(f"YandexGPT API error: {response.status_code} — {response.text}")
+            payload = self._build_payload(prompt, stop=stop, **kwargs)
+
+            tried: List[str] = []
+            while True:
+                try:
+                    with self._route(tried) as api_url:
+                        tried.append(api_url)
+                        response = requests.post(
+                            f"{api_url}/chat",
+                            json=payload,
+                            timeout=(llm_connect_timeout, llm_read_timeout)
+                        )
+                        if response.status_code != 200:
+                            raise LLMBackendError(response.status_code, response.text)
+                        data = response.json()
+                    break
+                except Exception as e:
+                    if not self._failover(e, tried):
+                        raise
+
+            return apply_stop(data.get("response", ""), payload.get("stop"))
 
         except Exception as e:
             raise Exception(f"Ошибка вызова YandexGPT: {e}")
 
+    def _cache_key(self, payload: dict) -> str:
+        """Ключ кэша: промпт, модель и параметры сэмплирования"""
+        params = {k: v for k, v in payload.items() if k not in ("prompt", "stream")}
+        return llm_cache.make_key(payload["prompt"], self.model_name, params)
+
+    async def _post_chat(self, payload: dict) -> dict:
+        """
+        Один запрос к /chat через общий пул (дубль при хеджировании уйдёт на другую реплику).
+        Если реплика не ответила, запрос один раз повторяется на другой здоровой.
+        """
+        tried: List[str] = []
+        while True:
+            try:
+                with self._route(tried) as api_url, span("llm.request", url=api_url):
+                    tried.append(api_url)
+                    response = await get_http_client().post(f"{api_url}/chat", json=payload, headers=inject_headers())
+                    if response.status_code != 200:
+                        raise LLMBackendError(response.status_code, response.text)
+                    return response.json()
+            except Exception as e:
+                if not self._failover(e, tried):
+                    raise
+
+    async def apredict(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        endpoint: Optional[str] = None,
+        **kwargs: Any,
+    ) -> str:
+        """
+        Асинхронный вызов YandexGPT API через общий пул соединений.
+
+        endpoint - имя вызывающего эндпоинта: задаёт бюджет токенов и стоп-последовательности,
+        а если он включён в LLM_CACHE_ENDPOINTS, ответ берётся из кэша и сохраняется в него.
+        Медленный запрос дублируется после p95 задержки эндпоинта; при разомкнутом
+        автомате сразу выбрасывается LLMUnavailableError.
+        """
+        payload = self._build_payload(prompt, endpoint=endpoint, stop=stop, **kwargs)
+
+        use_cache = llm_cache.enabled_for(endpoint)
+        if use_cache:
+            cache_key = self._cache_key(payload)
+            cached = llm_cache.get(cache_key, endpoint)
+            if cached is not None:
+                return cached
+
+        if not llm_breaker.allow():
+            raise LLMUnavailableError("YandexGPT временно недоступен")
+
+        tracker = get_latency_tracker(endpoint)
+        started = time.monotonic()
+        try:
+            with stage_timer("llm"):
+                data, hedge_fired, hedge_won = await hedged(
+                    lambda: self._post_chat(payload),
+                    tracker.hedge_delay()
+                )
+        except asyncio.CancelledError:
+            llm_breaker.release_probe()
+            raise
+        except Exception as e:
+            if is_backend_failure(e):
+                llm_breaker.record_failure()
+            else:
+                # Бэкенд ответил (например, 4xx) - это не сбой доступности
+                llm_breaker.record_success()
+            raise Exception(f"Ошибка вызова YandexGPT: {e!r}")
+
+        llm_breaker.record_success()
+        tracker.add(time.monotonic() - started)
+        tracker.hedged += hedge_fired
+        tracker.hedge_wins += hedge_won
+
+        text = apply_stop(data.get("response", ""), payload.get("stop"))
+        self._record_tokens(endpoint, payload, text, data.get("usage"))
+        if use_cache and text:
+            llm_cache.set(cache_key, text)
+        return text
+
+    async def stream_predict(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        endpoint: Optional[str] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        """
+        Потоковый вызов YandexGPT API: отдаёт фрагменты ответа по мере генерации.
+
+        Кэш, бюджеты токенов и автомат общие с apredict: попадание в кэш отдаётся
+        одним фрагментом. Стоп-последовательности применяются и к потоку: как
+        только одна из них появилась, поток обрывается. Поток не хеджируется;
+        если реплика не ответила до первого фрагмента, запрос один раз
+        повторяется на другой здоровой реплике.
+        """
+        payload = self._build_payload(prompt, endpoint=endpoint, stop=stop, **kwargs)
+
+        use_cache = llm_cache.enabled_for(endpoint)
+        if use_cache:
+            cache_key = self._cache_key(payload)
+            cached = llm_cache.get(cache_key, endpoint)
+            if cached is not None:
+                yield cached
+                return
+
+        if not llm_breaker.allow():
+            raise LLMUnavailableError("YandexGPT временно недоступен")
+
+        payload["stream"] = True
+        tried: List[str] = []
+
+        while True:
+            stop_filter = StopFilter(payload.get("stop"))
+            streamed = False
+            try:
+                with stage_timer("llm"), self._route(tried) as api_url:
+                    tried.append(api_url)
+                    async with get_http_client().stream(
+                        "POST", f"{api_url}/chat", json=payload, headers=inject_headers()
+                    ) as response:
+                        if response.status_code != 200:
+                            body = (await response.aread()).decode(errors="replace")
+                            raise LLMBackendError(response.status_code, body)
+
+                        # Бэкенд без поддержки стриминга отвечает обычным JSON целиком
+                        if response.headers.get("content-type", "").startswith("application/json"):
+                            data = json.loads(await response.aread())
+                            text = stop_filter.feed(data.get("response", ""))
+                            if text:
+                                streamed = True
+                                yield text
+                        else:
+                            async for line in response.aiter_lines():
+                                token = _parse_stream_line(line)
+                                if token is _STREAM_DONE:
+                                    break
+                                if token:
+                                    token = stop_filter.feed(token)
+                                    if token:
+                                        streamed = True
+                                        yield token
+                                if stop_filter.stopped:
+                                    # Бэкенд не учёл stop - дальше продолжение шаблона, не читаем его
+                                    break
+
+                        tail = stop_filter.flush()
+                        if tail:
+                            streamed = True
+                            yield tail
+                break
+
+            except (asyncio.CancelledError, GeneratorExit):
+                # Клиент ушёл посреди потока - исход пробы неизвестен
+                llm_breaker.release_probe()
+                raise
+            except Exception as e:
+                # Клиент уже получил часть ответа - повтор на другой реплике его бы перемешал
+                if not streamed and self._failover(e, tried):
+                    continue
+                if is_backend_failure(e):
+                    llm_breaker.record_failure()
+                else:
+                    llm_breaker.record_success()
+                raise Exception(f"Ошибка вызова YandexGPT: {e!r}")
+
+        llm_breaker.record_success()
+        text = stop_filter.text
+        self._record_tokens(endpoint, payload, text)
+        if use_cache and text:
+            llm_cache.set(cache_key, text)
+
     @property
     def _llm_type(self) -> str:
         return "yandexgpt"
@@ -63,7 +361,45 @@ class YandexGPTLangChain(BaseLLM):
         return LLMResult(generations=generations)
 
 
+_STREAM_DONE = object()
+
+
+def _parse_stream_line(line: str):
+    """
+    Достаёт фрагмент текста из строки потока (SSE "data: ..." или NDJSON).
+
+    Returns:
+        Текст фрагмента, None для служебных строк или _STREAM_DONE в конце потока
+    """
+    line = line.strip()
+    if not line or line.startswith(":") or line.startswith("event:"):
+        return None
+    if line.startswith("data:"):
+        line = line[5:].strip()
+    if line == "[DONE]":
+        return _STREAM_DONE
+
+    try:
+        chunk = json.loads(line)
+    except json.JSONDecodeError:
+        # Сырой текст без обёртки
+        return line
+
+    if not isinstance(chunk, dict):
+        return str(chunk)
+    if "choices" in chunk:
+        choices = chunk.get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content")
+    for key in ("response", "token", "text", "content"):
+        if chunk.get(key):
+            return chunk[key]
+    if chunk.get("done"):
+        return _STREAM_DONE
+    return None
+
+
 # Создание экземпляра
-llm = YandexGPTLangChain(api_url=model_url, model_name=model_name)
+llm_balancer = LLMBalancer(model_urls)
+llm = YandexGPTLangChain(api_url=model_urls[0], model_name=model_name, balancer=llm_balancer)
 
-print(f"Модель и URL: {llm.model_name}, {llm.api_url}")
\ No newline at end of file
+print(f"Модель и URL: {llm.model_name}, {', '.join(model_urls)}")
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""
+Профилирование живого трафика по запросу (GET /admin/profile).
+
+Сэмплирующий профилировщик: фоновый поток раз в interval снимает стеки всех
+потоков через sys._current_frames() и складывает их в формат collapsed stacks
+("кадр;кадр;кадр количество"), который понимают flamegraph.pl и speedscope.
+Стек потока цикла событий начинается с имени корутины текущей задачи, так что
+время раскладывается по обработчикам.
+
+Режимы:
+- cpu - все потоки, сэмплы простоя (ожидание в select, в очереди пула,
+  в сокете) отбрасываются;
+- wall - только поток цикла событий, включая ожидание: синхронные вызовы
+  requests/MySQL внутри async обработчиков видны как время в сокете под
+  кадрами обработчика, простой цикла собирается в один кадр [idle].
+
+Доступ - только с заголовком X-Admin-Token, равным ADMIN_TOKEN; без ADMIN_TOKEN
+эндпоинт выключен. Модуль общий для API и RAG сервера, поэтому не зависит
+от config.py.
+"""
+
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+admin_token = os.getenv("ADMIN_TOKEN", "")
+
+# Кадры-листья, означающие, что поток ждёт, а не работает: (файл, функция)
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("socket.py", "readinto"),
+    ("socket.py", "accept"),
+    ("ssl.py", "read"),
+    ("ssl.py", "recv_into"),
+    ("subprocess.py", "_communicate"),
+    ("thread.py", "_worker"),
+}
+
+# Кадры, которые в wall режиме означают простой цикла событий
+LOOP_IDLE_LEAVES = {("selectors.py", "select")}
+
+
+def _frame_key(frame) -> tuple:
+    code = frame.f_code
+    return os.path.basename(code.co_filename), code.co_name
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # Точка с запятой - разделитель кадров в collapsed формате
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _stack(frame) -> List[str]:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class SamplingProfiler:
+    """Один сеанс профилирования."""
+
+    def __init__(self, mode: str = "cpu", interval: float = 0.005, loop_thread_id: Optional[int] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        if mode not in ("cpu", "wall"):
+            raise ValueError(f"Неизвестный режим профилирования: {mode}")
+        self.mode = mode
+        self.interval = interval
+        self.loop_thread_id = loop_thread_id
+        self.loop = loop
+        self.samples: Counter = Counter()
+        self.total_samples = 0
+
+    def _task_label(self) -> Optional[str]:
+        """Корутина задачи, которая сейчас выполняется в цикле событий."""
+        if self.loop is None:
+            return None
+        try:
+            task = asyncio.current_task(self.loop)
+        except RuntimeError:
+            return None
+        if task is None:
+            return None
+        coro = task.get_coro()
+        return f"[task] {getattr(coro, '__qualname__', type(coro).__name__)}"
+
+    def sample(self):
+        """Снимает стеки потоков один раз."""
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            is_loop = thread_id == self.loop_thread_id
+            if self.mode == "wall" and not is_loop:
+                continue
+
+            leaf = _frame_key(frame)
+            if self.mode == "cpu" and leaf in IDLE_LEAVES:
+                continue
+
+            if self.mode == "wall" and leaf in LOOP_IDLE_LEAVES:
+                stack = ["[idle]"]
+            else:
+                stack = _stack(frame)
+                task_label = self._task_label() if is_loop else None
+                if task_label:
+                    stack.insert(0, task_label)
+
+            thread_label = "event-loop" if is_loop else names.get(thread_id, str(thread_id))
+            self.samples[";".join([thread_label] + stack)] += 1
+            self.total_samples += 1
+
+    def run(self, seconds: float) -> str:
+        """Сэмплирует seconds секунд и возвращает профиль в collapsed формате."""
+        deadline = time.monotonic() + seconds
+        next_at = time.monotonic()
+        while next_at < deadline:
+            self.sample()
+            next_at += self.interval
+            time.sleep(max(0.0, next_at - time.monotonic()))
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+profiler_router = APIRouter(prefix="/admin", tags=["admin"])
+_profile_lock = asyncio.Lock()
+
+
+@profiler_router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10, gt=0, le=60, description="Длительность профилирования"),
+    mode: str = Query("cpu", pattern="^(cpu|wall)$", description="cpu или wall"),
+    interval_ms: float = Query(5, ge=1, le=100, description="Интервал сэмплирования"),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Профилирует процесс seconds секунд под текущей нагрузкой.
+
+    Ответ - collapsed stacks для flamegraph.pl/speedscope.
+    """
+    # Сравнение за постоянное время - токен не подбирается по задержке ответа
+    if not admin_token or not hmac.compare_digest((x_admin_token or "").encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Доступ запрещён")
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="Профилирование уже выполняется")
+
+    async with _profile_lock:
+        profiler = SamplingProfiler(
+            mode=mode,
+            interval=interval_ms / 1000,
+            loop_thread_id=threading.get_ident(),
+            loop=asyncio.get_running_loop()
+        )
+        # Сэмплирование в отдельном потоке, цикл событий продолжает обслуживать трафик
+        result = await asyncio.to_thread(profiler.run, seconds)
+
+    headers: Dict[str, str] = {"X-Profile-Samples": str(profiler.total_samples)}
+    return PlainTextResponse(result, headers=headers)
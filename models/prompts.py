@@ -5,6 +5,9 @@ chat_template = """Ты - Дмитрий Александрович Тарано
 КОНТЕКСТ ИЗ БАЗЫ ЗНАНИЙ:
 {context}
 
+ИСТОРИЯ ДИАЛОГА:
+{history}
+
 ВОПРОС СОТРУДНИКА:
 {question}
 
@@ -14,9 +17,22 @@ chat_template = """Ты - Дмитрий Александрович Тарано
 3. Если в контексте нет информации - честно скажи об этом и предложи куда обратиться
 4. Сохраняй профессиональный и доброжелательный тон
 5. Отвечай как представитель руководства компании
+6. Учитывай историю диалога: короткий уточняющий вопрос относится к предыдущей теме
 
 ОТВЕТ:"""
 
+history_summary_template = """Сожми диалог сотрудника с ассистентом в краткое резюме на русском языке.
+Сохрани темы вопросов, ключевые факты из ответов и то, что сотрудник уже знает.
+Не добавляй ничего от себя, не используй markdown. Не более 5 предложений.
+
+ПРЕДЫДУЩЕЕ РЕЗЮМЕ:
+{summary}
+
+НОВЫЕ РЕПЛИКИ:
+{dialog}
+
+РЕЗЮМЕ:"""
+
 quiz_prompt = PromptTemplate(
     input_variables=["context", "format_instructions"],
     template="""
@@ -41,36 +57,38 @@ quiz_prompt = PromptTemplate(
 """)
 
 
-calibration_chat_template = """
-Ты - эксперт по оценке знаний в газотранспортной отрасли. 
-Проанализируй результаты калибровочного теста и определи, какие модули обучения пользователь может пропустить.
+scenario_prompt = PromptTemplate(
+    input_variables=["context", "focus", "format_instructions"],
+    template="""
+Ты — методист по охране труда и промышленной безопасности газотранспортного предприятия.
+Составь одну учебную ситуационную задачу для сотрудников на русском языке.
+
+Материал модуля (context):
+{context}
+
+Тема ситуации: {focus}
 
-Результаты теста:
+Требования к выходу:
+1. Опиши реалистичное происшествие на рабочем месте по указанной теме, по возможности связанное с материалом модуля.
+2. Задай вопрос о том, что должен сделать работник или ответственное лицо.
+3. Подготовь 4 варианта действий, только один из них правильный.
+4. В пояснении объясни, почему правильный вариант правильный, со ссылкой на требования безопасности.
+5. Не добавляй лишних комментариев, не используй markdown, не используй эмодзи.
+
+{format_instructions}
+""")
+
+
+calibration_reasoning_template = """
+Ты - эксперт по обучению сотрудников газотранспортной отрасли.
+Сотрудник прошёл калибровочный тест, программа обучения для него уже определена.
+
+Ответы сотрудника:
 {answers}
 
-Доступные модули:
-  "1": "История и миссия", 
-  "2": "Структура и активы",
-  "3": "Технологии и модернизация",
-  "4": "Безопасность и экология",
-  "5": "Персонал и корпоративная культура",
-  "6": "Социальная ответственность",
-  "7": "Инновации и цифровизация",
-  "8": "Экономика и эффективность",
-  "9": "Перспективы и стратегия",
-  "10": "Регламенты и нормативная документация"
-
-Критерии:
-- Новичок (0-3): не пропускать модули
-- Начальный уровень (4-7): пропустить 1-2 базовых модуля  
-- Средний уровень (8-11): пропустить 3-4 модуля
-- Опытный (12+): пропустить 5-6 модулей
-
-Правила:
-1. Модуль 0 не включать
-2. Минимум 4 модуля должны остаться
-3. Сначала пропускать базовые модули
-4. Модули 9-10 только для очень опытных
-
-Ответ в формате JSON: "skipped_modules": [], "reasoning": "обоснование"
+Итог: {score} из {max_score} баллов, уровень «{level}».
+Модули, которые можно пропустить: {skipped}.
+
+Кратко (2-3 предложения) объясни сотруднику, почему ему рекомендована такая программа.
+Не предлагай другой список модулей. Ответь только текстом обоснования, без JSON.
 """
@@ -1,11 +1,16 @@
 from langchain_core.output_parsers import JsonOutputParser
+from fastapi import HTTPException
 from pydantic import BaseModel, Field
 from typing import List
+import asyncio
 import logging
 
-from models.prompts import quiz_prompt
+from config import scenario_concurrency, scenario_extra_attempts
+from models.prompts import quiz_prompt, scenario_prompt
 from models.models import llm
-import os 
+from models.admission import admission
+from models.json_repair import parse_with_retry
+from models.content import content
 
 
 # Модель для структурированного вывода викторины
@@ -39,96 +44,161 @@ class ScenarioResponseModel(BaseModel):
 scenario_parser = JsonOutputParser(pydantic_object=ScenarioResponseModel)
 quiz_parser = JsonOutputParser(pydantic_object=QuizResponseModel)
 
-def generate_quiz_questions(context: str) -> list:
+async def generate_quiz(context: str, endpoint: str = "get_quiz") -> list:
     """
-    Генерирует вопросы викторины на основе переданного контекста.
-    
+    Генерирует и проверяет вопросы викторины.
+
     Args:
         context (str): Контекст для генерации вопросов
-        
+        endpoint (str): Эндпоинт для бюджета токенов и статистики LLM
+
     Returns:
         list: Список вопросов в формате JSON
+
+    Raises:
+        ValueError: Ответ LLM не прошёл проверку
     """
-    try:
-        # Форматируем промпт с инструкциями для JSON вывода
-        prompt = quiz_prompt.format(
-            context=context,
-            format_instructions=quiz_parser.get_format_instructions()
-        )
-        
-        # Получаем ответ от LLM
-        quiz_text = llm.predict(prompt)
-        
-        # Парсим JSON ответ
-        parsed_quiz = quiz_parser.parse(quiz_text)
-        # Преобразуем в список вопросов
-        quiz_list = []
-        for question in parsed_quiz["questions"]:
-            quiz_list.append({
-                "title": question["title"],
-                "variant_a": question["variant_a"],
-                "variant_b": question["variant_b"], 
-                "variant_c": question["variant_c"],
-                "variant_d": question["variant_d"],
-                "correct_answer": question["correct_answer"],
-                "explanation": question["explanation"]
-            })
-        
-        return quiz_list
-    
-        if quiz_list[0]['title'] == '':
-            logging.error(f"Ошибка при генерации вопросов викторины: {e}")
-            # Возвращаем пустой список в случае ошибки
-            return get_fallback_quiz()
-    
-    except Exception as e:
-        logging.error(f"Ошибка при генерации вопросов викторины: {e}")
-        # Возвращаем пустой список в случае ошибки
-        return get_fallback_quiz()
-    
+    # Форматируем промпт с инструкциями для JSON вывода
+    prompt = quiz_prompt.format(
+        context=context,
+        format_instructions=quiz_parser.get_format_instructions()
+    )
+
+    # Получаем ответ от LLM
+    quiz_text = await llm.apredict(prompt, endpoint=endpoint)
+
+    # Разбираем JSON ответ (с починкой) и отбрасываем некорректные вопросы
+    return await parse_with_retry(
+        quiz_text,
+        QuizResponseModel,
+        lambda repair_prompt: llm.apredict(repair_prompt, endpoint=endpoint),
+        endpoint,
+        _quiz_list
+    )
+
+
+def _quiz_list(parsed_quiz: QuizResponseModel) -> list:
+    """Вопросы викторины без некорректных; ValueError, если не осталось ни одного."""
+    quiz_list = [
+        question.model_dump() for question in parsed_quiz.questions
+        if question.title.strip() and question.correct_answer.strip().upper() in ("A", "B", "C", "D")
+    ]
+    if not quiz_list:
+        raise ValueError("LLM вернул пустую викторину")
+    return quiz_list
+
 
 def get_context_quiz(id_module):
-    files = os.listdir('data/data_summary')
+    """Краткое содержание модуля из снимка контента."""
+    return content.snapshot().summary(id_module)
 
-    filename = 'data/data_summary/' + [f for f in files if f[0] == str(id_module)][0]
-    with open(filename, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-        
-    return ''.join(lines)
 
+# Темы ситуаций: параллельные генерации получают разные темы, чтобы задачи не повторялись
+SCENARIO_FOCUSES = [
+    "утечка газа на линейной части газопровода",
+    "газоопасные работы в колодце или траншее",
+    "пожар или задымление на компрессорной станции",
+    "электробезопасность при обслуживании оборудования",
+    "работа на высоте",
+    "применение средств индивидуальной защиты",
+    "первая помощь пострадавшему",
+    "нарушение наряда-допуска подрядчиком",
+]
 
-def generate_scenario_questions() -> list:
-    try:
-        # Форматируем промпт с инструкциями для JSON вывода
-        prompt = scenario_prompt.format(
-            format_instructions=quiz_parser.get_format_instructions()
+
+async def generate_scenario(context: str, focus: str) -> dict:
+    """
+    Генерирует и проверяет одну ситуационную задачу.
+
+    Args:
+        context (str): Материал модуля
+        focus (str): Тема ситуации
+
+    Returns:
+        dict: Задача в формате Scenario
+
+    Raises:
+        ValueError: Ответ LLM не прошёл проверку
+    """
+    prompt = scenario_prompt.format(
+        context=context,
+        focus=focus,
+        format_instructions=scenario_parser.get_format_instructions()
+    )
+
+    async with admission.slot("get_scenario"):
+        scenario_text = await llm.apredict(prompt, endpoint="get_scenario")
+        # Повторный запрос на починку - в том же слоте допуска
+        return await parse_with_retry(
+            scenario_text,
+            ScenarioResponseModel,
+            lambda repair_prompt: llm.apredict(repair_prompt, endpoint="get_scenario"),
+            "get_scenario",
+            _scenario_dict
         )
-        
-        # Получаем ответ от LLM
-        scenario_text = llm.predict(prompt)
-        
-        # Парсим JSON ответ
-        parsed_quiz = quiz_parser.parse(scenario_text)
-
-        # Преобразуем в список вопросов
-        scenario_list = []
-        for question in parsed_quiz["questions"]:
-            scenario_list.append({
-                "title": question["title"],
-                "variant_a": question["variant_a"],
-                "variant_b": question["variant_b"], 
-                "variant_c": question["variant_c"],
-                "variant_d": question["variant_d"],
-                "correct_answer": question["correct_answer"],
-                "explanation": question["explanation"]
-            })
-        
-        return scenario_list
-        
-    except Exception as e:
-        logging.error(f"Ошибка при генерации вопросов викторины: {e}")
-        # Возвращаем пустой список в случае ошибки
-        return get_fallback_scenario()
+
+
+def _scenario_dict(parsed: ScenarioResponseModel) -> dict:
+    scenario = parsed.scenario.model_dump()
+    if scenario["correct_answer"].strip().upper() not in ("A", "B", "C", "D"):
+        raise ValueError(f"Некорректный правильный ответ сценария: {scenario['correct_answer'][:20]}")
+    return scenario
+
+
+async def generate_scenarios(context: str, count: int) -> list:
+    """
+    Генерирует count ситуационных задач параллельно (не больше
+    scenario_concurrency одновременных вызовов LLM) и возвращает их, как только
+    набралось count проверенных. Вместо каждой неудачной генерации запускается
+    новая, всего не больше scenario_extra_attempts дополнительных попыток.
+
+    Returns:
+        list: Задачи; запасная задача, если не удалось сгенерировать ни одной
+    """
+    semaphore = asyncio.Semaphore(scenario_concurrency)
+    max_attempts = count + scenario_extra_attempts
+    scenarios = []
+    pending = set()
+    launched = 0
+
+    async def attempt(index: int) -> dict:
+        async with semaphore:
+            return await generate_scenario(context, SCENARIO_FOCUSES[index % len(SCENARIO_FOCUSES)])
+
+    def launch():
+        nonlocal launched
+        pending.add(asyncio.create_task(attempt(launched)))
+        launched += 1
+
+    for _ in range(count):
+        launch()
+
+    try:
+        while pending and len(scenarios) < count:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            for task in done:
+                try:
+                    scenarios.append(task.result())
+                except HTTPException:
+                    # Отказ допуска: новые попытки получат тот же ответ
+                    if not scenarios:
+                        raise
+                    max_attempts = launched
+                except Exception as e:
+                    logging.warning(f"Сценарий не сгенерирован: {e!r}")
+                    if launched < max_attempts:
+                        launch()
+    finally:
+        # Генерации сверх нужного числа больше не нужны
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    if not scenarios:
+        logging.error("Не удалось сгенерировать ни одного сценария, выдаём запасной")
+        return [get_fallback_scenario()]
+    return scenarios[:count]
 
 
 def get_fallback_scenario() -> dict:
@@ -0,0 +1,197 @@
+"""
+Пул заранее сгенерированных викторин по модулям.
+
+Фоновые воркеры держат для каждого модуля QUIZ_POOL_DEPTH проверенных
+викторин; /get_quiz забирает готовую викторину из пула и будит пополнение.
+Генерация идёт через контроль допуска с самым низким приоритетом, чтобы не
+мешать диалогу. Для каждого пользователя запоминаются выданные вопросы
+(по хэшу текста) - повторно они ему не выдаются.
+"""
+
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+
+from config import (
+    quiz_pool_depth,
+    quiz_pool_workers,
+    quiz_pool_min_questions,
+    quiz_pool_users_max,
+    quiz_pool_retry_max,
+)
+from models.admission import admission
+from models.questions import generate_quiz, get_context_quiz
+
+
+def question_key(question: Dict[str, Any]) -> str:
+    """Идентификатор вопроса для учёта выданных: хэш нормализованного текста."""
+    title = " ".join(str(question.get("title", "")).split()).casefold()
+    return hashlib.sha1(title.encode("utf-8")).hexdigest()[:16]
+
+
+class QuizPool:
+    """Готовые викторины по модулям и учёт выданных пользователям вопросов."""
+
+    def __init__(
+        self,
+        depth: int = quiz_pool_depth,
+        workers: int = quiz_pool_workers,
+        min_questions: int = quiz_pool_min_questions,
+        users_max: int = quiz_pool_users_max,
+        retry_max: float = quiz_pool_retry_max
+    ):
+        self.depth = depth
+        self.workers = workers
+        self.min_questions = min_questions
+        self.users_max = users_max
+        self.retry_max = retry_max
+
+        self._pools: Dict[str, Deque[List[Dict[str, Any]]]] = {}
+        # Сколько генераций модуля сейчас в работе
+        self._in_progress: Dict[str, int] = {}
+        # Пауза после неудачной генерации модуля (секунды) и когда можно повторить
+        self._backoff: Dict[str, float] = {}
+        self._retry_at: Dict[str, float] = {}
+        # user_id -> module_id -> ключи выданных вопросов
+        self._served: "OrderedDict[int, Dict[str, Set[str]]]" = OrderedDict()
+
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._stats = {"served_from_pool": 0, "pool_misses": 0, "generated": 0, "generation_failures": 0}
+
+    def start(self, module_ids: Iterable[str]):
+        """Запускает воркеры пополнения для модулей (при старте приложения)."""
+        if self.depth <= 0 or self._tasks:
+            return
+        for module_id in module_ids:
+            self._pools.setdefault(str(module_id), deque())
+        self._wakeup = asyncio.Event()
+        for i in range(self.workers):
+            task = asyncio.create_task(self._worker(), name=f"quiz-pool-{i}")
+            self._tasks.add(task)
+
+    async def stop(self):
+        """Останавливает воркеры (при остановке приложения)."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _next_module(self) -> Optional[str]:
+        """Модуль, которому больше всех не хватает викторин (с учётом генераций в работе)."""
+        loop_time = asyncio.get_running_loop().time()
+        best, best_missing = None, 0
+        for module_id, pool in self._pools.items():
+            if self._retry_at.get(module_id, 0) > loop_time:
+                continue
+            missing = self.depth - len(pool) - self._in_progress.get(module_id, 0)
+            if missing > best_missing:
+                best, best_missing = module_id, missing
+        return best
+
+    async def _worker(self):
+        while True:
+            module_id = self._next_module()
+            if module_id is None:
+                self._wakeup.clear()
+                try:
+                    # Просыпаемся по выдаче викторины или чтобы повторить после паузы
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._in_progress[module_id] = self._in_progress.get(module_id, 0) + 1
+            try:
+                await self._refill_one(module_id)
+            finally:
+                self._in_progress[module_id] -= 1
+
+    async def _refill_one(self, module_id: str):
+        loop = asyncio.get_running_loop()
+        try:
+            context = get_context_quiz(module_id)
+            async with admission.slot("quiz_pool"):
+                quiz = await generate_quiz(context, endpoint="quiz_pool")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._stats["generation_failures"] += 1
+            backoff = min(self._backoff.get(module_id, 1.0) * 2, self.retry_max)
+            self._backoff[module_id] = backoff
+            self._retry_at[module_id] = loop.time() + backoff
+            logging.warning(f"Пул викторин: модуль {module_id} не сгенерирован ({e!r}), повтор через {backoff:.0f} с")
+            return
+
+        self._backoff.pop(module_id, None)
+        self._retry_at.pop(module_id, None)
+        self._pools.setdefault(module_id, deque()).append(quiz)
+        self._stats["generated"] += 1
+
+    def _served_for(self, user_id: Optional[int], module_id: str) -> Optional[Set[str]]:
+        if user_id is None:
+            return None
+        modules = self._served.get(user_id)
+        if modules is None:
+            modules = self._served[user_id] = {}
+            while len(self._served) > self.users_max:
+                self._served.popitem(last=False)
+        else:
+            self._served.move_to_end(user_id)
+        return modules.setdefault(module_id, set())
+
+    def take(self, module_id: int, user_id: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Забирает викторину из пула. Уже выданные пользователю вопросы
+        отбрасываются; викторина, в которой осталось меньше min_questions
+        новых вопросов, пропускается. Пулы создаются только в start -
+        неизвестный модуль просто не находится.
+
+        Returns:
+            Список вопросов или None, если подходящей готовой викторины нет
+        """
+        module_id = str(module_id)
+        pool = self._pools.get(module_id)
+        if pool is None:
+            self._stats["pool_misses"] += 1
+            return None
+        served = self._served_for(user_id, module_id)
+
+        quiz = None
+        for candidate in list(pool):
+            fresh = [q for q in candidate if served is None or question_key(q) not in served]
+            if len(fresh) >= min(self.min_questions, len(candidate)):
+                pool.remove(candidate)
+                quiz = fresh
+                break
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+        if quiz is None:
+            self._stats["pool_misses"] += 1
+            return None
+
+        self._stats["served_from_pool"] += 1
+        self.mark_served(module_id, user_id, quiz)
+        return quiz
+
+    def mark_served(self, module_id: int, user_id: Optional[int], quiz: List[Dict[str, Any]]):
+        """Запоминает вопросы, выданные пользователю (в том числе сгенерированные на лету)."""
+        served = self._served_for(user_id, str(module_id))
+        if served is not None:
+            served.update(question_key(question) for question in quiz)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "depth": self.depth,
+            "modules": {module_id: len(pool) for module_id, pool in self._pools.items()},
+            "users_tracked": len(self._served)
+        }
+
+
+# Общий пул на процесс
+quiz_pool = QuizPool()
@@ -1,32 +1,116 @@
-import requests
-
-
-def get_context():
-    # url = "http://localhost:8022/answer"
-    # headers = {
-    #     "Content-Type": "application/json"
-    # }
-    # data = {
-    #     "query": "Какие требования к газоопасным работам?",
-    #     "top_k": "5",
-    #     "max_context_length": 2000
-    # }
-
-    # response = requests.post(url, headers=headers, json=data)
-    # result = response.json()
-    
-    # context = result['context']
-    
-    # sources = []
-    # for chunk in result['relevant_chunks']:
-    #     chunk_sources = {
-    #         # 'document_name': chunk['document_name'],
-    #         'document_short_name': chunk['document_source'],
-    #         'page_number': chunk['page_number']
-    #     }
-        
-    #     sources.append(chunk_sources)
-    
-    context = ''
-    return context
-        
\ No newline at end of file
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    rag_mode,
+    rag_vector_store_dir,
+    ollama_url,
+    ollama_model,
+    rag_top_k,
+    rag_max_context_length,
+)
+from models.rag_client import rag_client
+from models.metrics import stage_timer
+
+
+# Общий на весь процесс экземпляр RAGAgent (режим RAG_MODE=local)
+local_agent = None
+
+
+def init_rag_agent():
+    """
+    Загружает RAGAgent в процесс API один раз при старте приложения.
+
+    Returns:
+        RAGAgent или None, если режим local не включён или загрузка не удалась
+    """
+    global local_agent
+
+    if rag_mode != 'local' or local_agent is not None:
+        return local_agent
+
+    try:
+        # Импорт здесь: faiss нужен только в режиме local
+        from rag_agent.rag_agent import RAGAgent
+
+        local_agent = RAGAgent(
+            vector_store_dir=rag_vector_store_dir,
+            ollama_model=ollama_model,
+            ollama_url=ollama_url,
+            top_k=rag_top_k
+        )
+    except Exception as e:
+        logging.error(f"Не удалось загрузить RAG агент, контекст будет пустым: {e}")
+        local_agent = None
+
+    return local_agent
+
+
+async def init_rag():
+    """Готовит источник контекста согласно RAG_MODE (вызывается при старте API)."""
+    if rag_mode == 'local':
+        init_rag_agent()
+    elif rag_mode == 'remote':
+        await rag_client.start()
+
+
+async def close_rag():
+    """Освобождает ресурсы источника контекста при остановке API."""
+    if rag_mode == 'remote':
+        await rag_client.close()
+
+
+def _extract_sources(result: Dict) -> List[Dict]:
+    """Оставляет в источниках только поля, которые нужны фронтенду."""
+    sources = []
+    for source in result.get('sources', []):
+        sources.append({
+            'document_name': source.get('document_name'),
+            'document_short_name': source.get('document_short_name'),
+            'document_number': source.get('document_number'),
+            'document_date': source.get('document_date')
+        })
+    return sources
+
+
+async def get_context(question: str, top_k: Optional[int] = None) -> Tuple[str, List[Dict]]:
+    """
+    Получает контекст из базы знаний для вопроса.
+
+    Args:
+        question: Текст вопроса
+        top_k: Количество чанков (по умолчанию RAG_TOP_K)
+
+    Returns:
+        (context, sources) - текст контекста и список источников
+    """
+    if rag_mode == 'remote':
+        # Клиент сам соблюдает дедлайн и при задержке возвращает None
+        with stage_timer("rag"):
+            result = await rag_client.answer(
+                question,
+                top_k=top_k or rag_top_k,
+                max_context_length=rag_max_context_length
+            )
+        if result is None:
+            return '', []
+        return result.get('context', ''), _extract_sources(result)
+
+    if local_agent is None:
+        return '', []
+
+    try:
+        # Поиск блокирующий (requests к Ollama + FAISS), уводим в поток
+        with stage_timer("rag"):
+            result = await asyncio.to_thread(
+                local_agent.answer,
+                question,
+                top_k or rag_top_k,
+                rag_max_context_length
+            )
+    except Exception as e:
+        logging.error(f"Ошибка при получении контекста RAG: {e}")
+        return '', []
+
+    return result.get('context', ''), _extract_sources(result)
@@ -0,0 +1,209 @@
+"""
+Клиент удалённого RAG сервера (rag_agent/rag_api_server.py).
+
+Один постоянный пул соединений на процесс, жёсткий дедлайн на каждый вызов
+и ограниченное число повторов. Одновременные запросы автоматически
+собираются в пакет и уходят одним вызовом /answer_batch.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from models.tracing import span, inject_headers
+from config import (
+    rag_url,
+    rag_timeout,
+    rag_retries,
+    rag_batch_window_ms,
+    rag_batch_max_size,
+    rag_pool_size,
+)
+
+
+class RAGServerError(Exception):
+    """Ошибка 5xx от RAG сервера - запрос можно повторить."""
+
+
+class RAGClient:
+    """Асинхронный клиент RAG сервера с пакетированием одновременных запросов."""
+
+    def __init__(
+        self,
+        base_url: str = rag_url,
+        timeout: float = rag_timeout,
+        retries: int = rag_retries,
+        batch_window_ms: float = rag_batch_window_ms,
+        batch_max_size: int = rag_batch_max_size,
+        pool_size: int = rag_pool_size
+    ):
+        """
+        Args:
+            base_url: Адрес RAG сервера
+            timeout: Дедлайн на весь вызов в секундах, включая повторы
+            retries: Сколько раз повторять запрос при сетевой ошибке или 5xx
+            batch_window_ms: Сколько ждать попутные запросы перед отправкой пакета
+            batch_max_size: Максимальный размер пакета
+            pool_size: Размер пула keep-alive соединений
+        """
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.batch_window = batch_window_ms / 1000
+        self.batch_max_size = batch_max_size
+        self.pool_size = pool_size
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._pending: List[Tuple[Dict, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def start(self):
+        """Создаёт пул соединений (вызывается при старте приложения)."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size
+                ),
+                timeout=self.timeout
+            )
+
+    async def close(self):
+        """Закрывает пул соединений, ожидающие вызовы получают пустой результат."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        for _, future in self._pending:
+            if not future.done():
+                future.set_result(None)
+        self._pending = []
+
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def answer(
+        self,
+        query: str,
+        top_k: int = 5,
+        max_context_length: int = 2000
+    ) -> Optional[Dict]:
+        """
+        Получает контекст для вопроса.
+
+        Args:
+            query: Текст вопроса
+            top_k: Количество релевантных чанков
+            max_context_length: Максимальная длина контекста в символах
+
+        Returns:
+            Ответ /answer RAG сервера или None, если дедлайн истёк или сервер недоступен
+        """
+        if self._client is None:
+            await self.start()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(({
+            'query': query,
+            'top_k': top_k,
+            'max_context_length': max_context_length
+        }, future))
+
+        if len(self._pending) >= self.batch_max_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+
+        try:
+            # shield: отмена одного ожидающего не отменяет отправку всего пакета
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"RAG сервер не ответил за {self.timeout} с, контекст будет пустым")
+            return None
+
+    def _flush(self):
+        """Отправляет накопленные запросы одним пакетом."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        """Выполняет пакет и раздаёт результаты ожидающим."""
+        deadline = time.monotonic() + self.timeout
+        payloads = [payload for payload, _ in batch]
+
+        try:
+            # Пакет попадает в трассу того запроса, который его открыл
+            with span("rag.batch", size=len(payloads)):
+                results = await self._post_with_retries(payloads, deadline)
+        except Exception as e:
+            logging.error(f"Ошибка запроса к RAG серверу ({len(payloads)} шт.): {e!r}")
+            results = []
+
+        for i, (_, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(results[i] if i < len(results) else None)
+
+    async def _post_with_retries(self, payloads: List[Dict], deadline: float) -> List[Dict]:
+        """Повторяет запрос при сетевых ошибках и 5xx, не выходя за дедлайн."""
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("дедлайн запроса к RAG серверу истёк")
+
+            try:
+                return await self._post(payloads, remaining)
+            except (httpx.TransportError, RAGServerError):
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                # Короткая экспоненциальная пауза, но не дольше остатка дедлайна
+                backoff = min(0.05 * 2 ** (attempt - 1), max(deadline - time.monotonic(), 0))
+                await asyncio.sleep(backoff)
+
+    async def _post(self, payloads: List[Dict], timeout: float) -> List[Dict]:
+        """Один запрос: /answer для одиночного вопроса, /answer_batch для пакета."""
+        if len(payloads) == 1:
+            response = await self._client.post(
+                '/answer',
+                json=payloads[0],
+                headers=inject_headers(),
+                timeout=timeout
+            )
+            self._check_status(response)
+            return [response.json()]
+
+        response = await self._client.post(
+            '/answer_batch',
+            json={'requests': payloads},
+            headers=inject_headers(),
+            timeout=timeout
+        )
+        self._check_status(response)
+        return response.json().get('results', [])
+
+    @staticmethod
+    def _check_status(response: httpx.Response):
+        if response.status_code >= 500:
+            raise RAGServerError(f"RAG сервер: HTTP {response.status_code}")
+        response.raise_for_status()
+
+
+# Общий клиент на процесс
+rag_client = RAGClient()
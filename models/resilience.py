@@ -0,0 +1,169 @@
+"""
+Защита от хвостовых задержек LLM бэкенда.
+
+- LatencyTracker: скользящее окно задержек по эндпоинту, из него берётся p95.
+- hedged: если первый запрос не ответил за задержку (по p95), отправляется
+  дублирующий, побеждает первый успешный ответ.
+- CircuitBreaker: после серии таймаутов/сбоев запросы сразу отклоняются,
+  через reset_timeout пропускается один пробный запрос (half-open).
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from config import (
+    llm_hedge_enabled,
+    llm_hedge_percentile,
+    llm_hedge_min_delay,
+    llm_hedge_min_samples,
+    llm_breaker_failures,
+    llm_breaker_reset_timeout,
+)
+
+
+class LLMUnavailableError(Exception):
+    """LLM бэкенд недоступен: автомат разомкнут, запрос не отправлялся."""
+
+
+class LatencyTracker:
+    """Последние задержки успешных вызовов и счётчики хеджирования."""
+
+    def __init__(self, window: int = 200, min_samples: int = llm_hedge_min_samples):
+        self._samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q-й процентиль (0-100) или None, пока данных мало."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * q / 100))
+        return ordered[index]
+
+    def hedge_delay(self) -> Optional[float]:
+        """Через сколько секунд отправлять дублирующий запрос (None - не хеджировать)."""
+        if not llm_hedge_enabled:
+            return None
+        p = self.percentile(llm_hedge_percentile)
+        if p is None:
+            return None
+        return max(p, llm_hedge_min_delay)
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            "samples": len(self._samples),
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins
+        }
+
+
+async def hedged(
+    call: Callable[[], Awaitable[Any]],
+    delay: Optional[float]
+) -> Tuple[Any, bool, bool]:
+    """
+    Выполняет call, при необходимости дублируя его через delay секунд.
+
+    Returns:
+        (результат, был ли отправлен дубль, победил ли дубль)
+    """
+    tasks = [asyncio.ensure_future(call())]
+    try:
+        if delay is None:
+            return await tasks[0], False, False
+
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result(), False, False
+
+        tasks.append(asyncio.ensure_future(call()))
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), True, task is tasks[1]
+                error = task.exception()
+        raise error
+    finally:
+        # Проигравший (или брошенный при отмене) запрос больше не нужен
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+class CircuitBreaker:
+    """Автомат: closed -> open после серии сбоев -> half_open (одна проба) -> closed."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = llm_breaker_failures,
+        reset_timeout: float = llm_breaker_reset_timeout
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.opened_count = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос сейчас."""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+
+        self.rejected += 1
+        return False
+
+    def release_probe(self):
+        """Пробный запрос отменён без результата - следующий сможет пройти."""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        """Бэкенд ответил - автомат замыкается."""
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        """Таймаут или сбой бэкенда."""
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened_count += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_count": self.opened_count,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,146 @@
+"""
+Серверные сессии диалога для /get_answer.
+
+В промпт попадают резюме старой части диалога и ещё не свёрнутые реплики.
+Последние реплики в пределах окна CHAT_HISTORY_WINDOW_TOKENS всегда идут
+дословно; когда реплики старше окна набирают CHAT_HISTORY_FOLD_TOKENS,
+они в фоне сворачиваются в резюме, так что размер промпта остаётся
+примерно постоянным. Сессии хранятся в памяти процесса с ограничением
+по количеству и вытеснением по простою.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from config import (
+    chat_sessions_max,
+    chat_session_idle_timeout,
+    chat_history_window_tokens,
+    chat_history_fold_tokens,
+    chat_summary_max_tokens,
+)
+from models.admission import admission
+from models.models import llm
+from models.prompts import history_summary_template
+from models.tokens import estimate_tokens, CHARS_PER_TOKEN
+
+
+def format_turn(question: str, answer: str) -> str:
+    """Одна реплика диалога в виде текста для промпта."""
+    return f"Сотрудник: {question}\nАссистент: {answer}"
+
+
+@dataclass
+class ChatSession:
+    """История одного диалога."""
+    session_id: str
+    turns: List[Tuple[str, str]] = field(default_factory=list)
+    summary: str = ''
+    last_access: float = field(default_factory=time.monotonic)
+    folding: bool = False
+
+    def history_text(self) -> str:
+        """История для подстановки в chat_template."""
+        parts = []
+        if self.summary:
+            parts.append(f"Резюме предыдущего диалога: {self.summary}")
+        parts.extend(format_turn(question, answer) for question, answer in self.turns)
+        return '\n\n'.join(parts) or 'Нет'
+
+    def last_question(self) -> Optional[str]:
+        return self.turns[-1][0] if self.turns else None
+
+    def count_older_turns(self, window_tokens: int) -> int:
+        """Сколько первых реплик не помещаются в окно последних window_tokens токенов."""
+        used = 0
+        for i in range(len(self.turns) - 1, -1, -1):
+            used += estimate_tokens(format_turn(*self.turns[i]))
+            if used > window_tokens:
+                return i + 1
+        return 0
+
+
+class SessionStore:
+    """Хранилище сессий: LRU по обращению, ограничение размера и таймаут простоя."""
+
+    def __init__(
+        self,
+        max_sessions: int = chat_sessions_max,
+        idle_timeout: float = chat_session_idle_timeout
+    ):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._tasks = set()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: Optional[str] = None) -> ChatSession:
+        """Возвращает сессию по id или создаёт новую."""
+        self._evict_idle()
+
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None:
+            session = ChatSession(session_id=session_id or uuid.uuid4().hex)
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session.session_id)
+
+        session.last_access = time.monotonic()
+        return session
+
+    def _evict_idle(self):
+        """Удаляет сессии без обращений дольше idle_timeout (самые старые - в начале)."""
+        expired_before = time.monotonic() - self.idle_timeout
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_access >= expired_before:
+                break
+            self._sessions.popitem(last=False)
+
+    def record_turn(self, session: ChatSession, question: str, answer: str):
+        """Добавляет реплику и при необходимости запускает сворачивание в резюме."""
+        session.turns.append((question, answer))
+
+        older = session.count_older_turns(chat_history_window_tokens)
+        if session.folding or older == 0:
+            return
+
+        older_tokens = sum(estimate_tokens(format_turn(*turn)) for turn in session.turns[:older])
+        if older_tokens < chat_history_fold_tokens:
+            return
+
+        session.folding = True
+        task = asyncio.create_task(self._fold(session, older))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fold(self, session: ChatSession, count: int):
+        """Сворачивает первые count реплик в резюме."""
+        try:
+            dialog = '\n\n'.join(format_turn(*turn) for turn in session.turns[:count])
+            prompt = history_summary_template.format(summary=session.summary or 'Нет', dialog=dialog)
+            try:
+                # Резюме подождёт: слот берётся с самым низким приоритетом
+                async with admission.slot("chat_summary"):
+                    summary = (await llm.apredict(prompt, endpoint="chat_summary")).strip()
+                session.summary = summary[:chat_summary_max_tokens * CHARS_PER_TOKEN]
+            except Exception as e:
+                # Реплики всё равно убираем, чтобы история оставалась ограниченной
+                logging.error(f"Не удалось свернуть историю сессии {session.session_id}: {e}")
+            # Новые реплики добавляются только в конец, поэтому первые count - те же самые
+            del session.turns[:count]
+        finally:
+            session.folding = False
+
+
+# Общее хранилище сессий на процесс
+session_store = SessionStore()
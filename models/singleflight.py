@@ -0,0 +1,91 @@
+"""
+Схлопывание одинаковых одновременных запросов (single-flight).
+
+Когда группа стажёров одновременно открывает один модуль, приходят десятки
+одинаковых /get_quiz и /get_answer. SingleFlight.do запускает вычисление
+для ключа один раз в отдельной задаче, остальные одинаковые запросы ждут
+её результат (или исключение). Ожидание идёт через asyncio.shield: отмена
+одного ожидающего (клиент отключился) не отменяет вычисление для остальных;
+вычисление отменяется, только когда не осталось ни одного ожидающего.
+После завершения ключ освобождается - результат не кэшируется.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def fingerprint(*parts: Any) -> Tuple[str, ...]:
+    """Ключ запроса: части без различий в регистре и пробелах."""
+    return tuple(" ".join(str(part).split()).casefold() for part in parts)
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Общие вычисления для одинаковых одновременных запросов."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        # Пространство ключей (первая часть ключа) -> счётчики
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _namespace_stats(self, key: Hashable) -> Dict[str, int]:
+        namespace = str(key[0]) if isinstance(key, tuple) and key else str(key)
+        return self._stats.setdefault(namespace, {"executed": 0, "shared": 0})
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Результат fn() для ключа; если такое же вычисление уже идёт - его результат.
+
+        Args:
+            key: Отпечаток запроса (например, fingerprint("get_quiz", module_id))
+            fn: Вычисление; вызывается, только если для ключа ничего не выполняется
+        """
+        stats = self._namespace_stats(key)
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finish(key, call))
+            stats["executed"] += 1
+        else:
+            stats["shared"] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            # Последний ожидающий ушёл - результат никому не нужен. Ключ освобождаем
+            # сразу: новый запрос не должен присоединиться к отменяемой задаче
+            if call.waiters == 1 and not call.task.done():
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _finish(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Ожидающих могло не остаться: помечаем исключение полученным, чтобы asyncio не писал его в лог
+        if not call.task.cancelled():
+            call.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "endpoints": {namespace: dict(stats) for namespace, stats in self._stats.items()}
+        }
+
+
+# Общий на процесс
+singleflight = SingleFlight()
@@ -2,6 +2,7 @@ import requests
 import subprocess
 
 from config import gigachat_token
+from models.metrics import stage_timer
 
 
 def webm_bytes_to_mp3_bytes(webm_bytes: bytes) -> bytes:
@@ -20,7 +21,8 @@ def webm_bytes_to_mp3_bytes(webm_bytes: bytes) -> bytes:
   )
 
   # Передаем webm-байты на вход ffmpeg и читаем mp3-байты с выхода
-  mp3_bytes, error = process.communicate(input=webm_bytes)
+  with stage_timer("ffmpeg"):
+    mp3_bytes, error = process.communicate(input=webm_bytes)
 
   if process.returncode != 0:
     raise RuntimeError(f'FFmpeg error: {error.decode()}')
@@ -43,7 +45,8 @@ def get_text_from_speech(video_data):
       'Authorization': f'Basic {gigachat_token}'
     }
 
-    response = requests.request("POST", url, headers=headers, data=payload, verify=False)
+    with stage_timer("stt"):
+        response = requests.request("POST", url, headers=headers, data=payload, verify=False)
 
     access_token = response.json()['access_token']
 
@@ -58,7 +61,8 @@ def get_text_from_speech(video_data):
       'Authorization': f'Bearer {access_token}'
     }
 
-    response = requests.request("POST", url, headers=headers, data=audio_bytes, verify=False)
+    with stage_timer("stt"):
+        response = requests.request("POST", url, headers=headers, data=audio_bytes, verify=False)
 
     return response.json()['result'][0]
 
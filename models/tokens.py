@@ -0,0 +1,143 @@
+"""
+Учёт токенов для вызовов LLM.
+
+Оценка числа токенов без токенизатора модели: для русского текста у
+BPE-токенизаторов выходит примерно 3 символа на токен, этого достаточно
+для бюджетирования промптов и истории диалога. Здесь же - бюджеты
+генерации по эндпоинтам и счётчики prompt/completion токенов.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from config import llm_max_tokens, chat_summary_max_tokens
+
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Приблизительное число токенов в тексте."""
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+@dataclass(frozen=True)
+class TokenBudget:
+    """Лимит генерации и стоп-последовательности для эндпоинта."""
+    max_tokens: int
+    stop: Tuple[str, ...] = ()
+
+
+ENDPOINT_BUDGETS = {
+    # Ответ в чате - один-два абзаца; модель не должна продолжать шаблон промпта
+    "get_answer": TokenBudget(
+        max_tokens=llm_max_tokens["get_answer"],
+        stop=("\nВОПРОС СОТРУДНИКА:", "\nИСТОРИЯ ДИАЛОГА:")
+    ),
+    # Три вопроса викторины в JSON
+    "get_quiz": TokenBudget(max_tokens=llm_max_tokens["get_quiz"]),
+    # Короткий JSON со списком модулей и обоснованием
+    "analyze_calibration": TokenBudget(max_tokens=llm_max_tokens["analyze_calibration"]),
+    "get_scenario": TokenBudget(max_tokens=llm_max_tokens["get_scenario"]),
+    # Фоновое резюме старых реплик диалога
+    "chat_summary": TokenBudget(max_tokens=chat_summary_max_tokens),
+}
+
+DEFAULT_BUDGET = TokenBudget(max_tokens=llm_max_tokens["default"])
+
+
+def get_budget(endpoint: Optional[str]) -> TokenBudget:
+    """Бюджет эндпоинта (или общий по умолчанию)."""
+    return ENDPOINT_BUDGETS.get(endpoint, DEFAULT_BUDGET)
+
+
+def apply_stop(text: str, stop: Optional[Tuple[str, ...]]) -> str:
+    """Обрезает текст по первой стоп-последовательности (если бэкенд её не учёл)."""
+    if not stop:
+        return text
+    cut = len(text)
+    for sequence in stop:
+        position = text.find(sequence)
+        if position != -1:
+            cut = min(cut, position)
+    return text[:cut]
+
+
+class StopFilter:
+    """
+    apply_stop для потока: фрагменты отдаются с задержкой на длину самой
+    длинной стоп-последовательности (минус один символ), чтобы не отдать
+    клиенту начало стопа, разрезанного между фрагментами.
+    """
+
+    def __init__(self, stop: Optional[Tuple[str, ...]]):
+        self.stop = tuple(sequence for sequence in stop or () if sequence)
+        self._hold = max((len(sequence) for sequence in self.stop), default=1) - 1
+        self.text = ""
+        self.stopped = False
+        self._emitted = 0
+
+    def feed(self, chunk: str) -> str:
+        """Добавляет фрагмент; возвращает часть текста, которую уже можно отдать."""
+        if self.stopped or not chunk:
+            return ""
+        # Стоп мог начаться в хвосте, придержанном с прошлых фрагментов
+        start = max(0, len(self.text) - self._hold)
+        self.text += chunk
+        positions = [p for p in (self.text.find(sequence, start) for sequence in self.stop) if p != -1]
+        if positions:
+            self.text = self.text[:min(positions)]
+            self.stopped = True
+            return self._take(len(self.text))
+        return self._take(len(self.text) - self._hold)
+
+    def flush(self) -> str:
+        """Остаток текста после конца потока."""
+        return self._take(len(self.text))
+
+    def _take(self, end: int) -> str:
+        if end <= self._emitted:
+            return ""
+        part = self.text[self._emitted:end]
+        self._emitted = end
+        return part
+
+
+class TokenMeter:
+    """Счётчики prompt/completion токенов по эндпоинтам."""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, endpoint: Optional[str], prompt_tokens: int, completion_tokens: int, max_tokens: int):
+        stats = self._stats.setdefault(endpoint or "other", {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "max_prompt_tokens": 0,
+            "budget_exhausted": 0
+        })
+        stats["requests"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        stats["max_prompt_tokens"] = max(stats["max_prompt_tokens"], prompt_tokens)
+        # Генерация упёрлась в лимит - ответ, скорее всего, обрезан
+        if completion_tokens >= max_tokens:
+            stats["budget_exhausted"] += 1
+
+    def stats(self) -> Dict[str, Dict]:
+        result = {}
+        for endpoint, stats in self._stats.items():
+            requests = stats["requests"]
+            result[endpoint] = {
+                **stats,
+                "budget": get_budget(endpoint).max_tokens,
+                "avg_prompt_tokens": round(stats["prompt_tokens"] / requests, 1),
+                "avg_completion_tokens": round(stats["completion_tokens"] / requests, 1)
+            }
+        return result
+
+
+# Общие счётчики на процесс
+token_meter = TokenMeter()
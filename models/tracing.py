@@ -0,0 +1,176 @@
+"""
+Лёгкая трассировка запросов между API и RAG сервером.
+
+Спаны открываются контекстным менеджером span(); текущий спан хранится в
+contextvars, поэтому вложенность сохраняется через await и asyncio.to_thread.
+Трасса передаётся между сервисами в заголовке W3C traceparent, решение о
+сэмплировании принимает сервис, начавший трассу (TRACE_SAMPLE_RATE).
+Завершённые спаны сэмплированных трасс пишутся фоновым потоком в JSON lines
+(TRACE_FILE) - по одному спану в строке, трасса собирается по trace_id.
+
+Модуль используется и RAG сервером, поэтому не зависит от config.py и
+сторонних пакетов.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+TRACEPARENT_HEADER = "traceparent"
+
+trace_sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+trace_file = os.getenv("TRACE_FILE", "traces.jsonl")
+trace_service = os.getenv("TRACE_SERVICE", "bezbot-api")
+
+
+class Span:
+    """Один замер в трассе."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "sampled", "attributes", "start", "duration", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.sampled = sampled
+        self.attributes: Dict[str, Any] = {}
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any):
+        """Добавляет атрибуты спана."""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": trace_service,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class _Exporter:
+    """Пишет спаны в файл из фонового потока, чтобы не блокировать цикл событий."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: "queue.SimpleQueue[Dict[str, Any]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        self._queue.put(span.to_dict())
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, "a", encoding="utf-8") as file:
+                    for record in batch:
+                        file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            except OSError as e:
+                logging.warning(f"Не удалось записать трассы в {self.path}: {e}")
+
+
+_exporter = _Exporter(trace_file)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+def parse_traceparent(header: Optional[str]):
+    """traceparent "00-<trace_id>-<span_id>-<flags>" -> (trace_id, span_id, sampled) или None."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def inject_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Добавляет traceparent текущего спана к заголовкам исходящего запроса."""
+    headers = dict(headers or {})
+    span = _current_span.get()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = f"00-{span.trace_id}-{span.span_id}-{'01' if span.sampled else '00'}"
+    return headers
+
+
+@contextmanager
+def span(name: str, traceparent: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+    """
+    Открывает спан - дочерний к текущему, к traceparent из входящего запроса
+    или корневой новой трассы.
+    """
+    parent = _current_span.get()
+    incoming = parse_traceparent(traceparent) if parent is None else None
+
+    if parent is not None:
+        current = Span(name, parent.trace_id, parent.span_id, parent.sampled)
+    elif incoming is not None:
+        trace_id, parent_id, sampled = incoming
+        current = Span(name, trace_id, parent_id, sampled)
+    else:
+        current = Span(name, secrets.token_hex(16), None, random.random() < trace_sample_rate)
+
+    if attributes:
+        current.attributes.update(attributes)
+
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Спан внутри async-генератора, закрытого уже из другого контекста
+            pass
+        if current.sampled:
+            _exporter.export(current)
@@ -1,10 +1,25 @@
 import json
 import os
 import random
+import stat
+import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 # Путь к JSON файлу
 QUIZ_JSON_PATH = Path(__file__).parent / "quiz.json"
+# Номер версии quiz.json - читатели сверяют его, не разбирая JSON
+QUIZ_VERSION_PATH = QUIZ_JSON_PATH.with_name("quiz.json.version")
+# Блокировка записи между процессами (воркерами uvicorn)
+QUIZ_LOCK_PATH = QUIZ_JSON_PATH.with_name("quiz.json.lock")
+
+_write_lock = threading.Lock()
 
 
 def load_quiz_data():
@@ -15,6 +30,11 @@ def load_quiz_data():
     with open(QUIZ_JSON_PATH, 'r', encoding='utf-8') as f:
         data = json.load(f)
     
+    return parse_quiz_data(data)
+
+
+def parse_quiz_data(data: dict):
+    """Названия модулей и текущие версии тестов из содержимого quiz.json."""
     # Преобразуем строковые ключи в числовые для tests
     test_names = data['test_names']
     tests_raw = data['tests']
@@ -23,21 +43,108 @@ def load_quiz_data():
     tests = {}
     for k, v in tests_raw.items():
         module_id = int(k)
-        # Если это структура с версиями (для модуля 1)
+        # Если это структура с версиями
         if isinstance(v, dict) and 'current_version' in v and 'versions' in v:
             current = v['current_version']
             tests[module_id] = v['versions'][str(current)]
         else:
-            # Обычная структура (для остальных модулей)
+            # Обычная структура (модуль без версий)
             tests[module_id] = v
     
     return test_names, tests
 
 
+def parse_quiz_variants(data: dict):
+    """Все версии вопросов каждого модуля (по возрастанию номера версии) из содержимого quiz.json."""
+    variants = {}
+    for k, v in data['tests'].items():
+        if isinstance(v, dict) and 'versions' in v:
+            variants[int(k)] = [v['versions'][n] for n in sorted(v['versions'], key=int)]
+        else:
+            variants[int(k)] = [v]
+    return variants
+
+
+def read_quiz_version() -> int:
+    """Текущая версия quiz.json (0, если версий ещё не было)."""
+    try:
+        return int(QUIZ_VERSION_PATH.read_text(encoding="utf-8").strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _atomic_write(path: Path, text: str):
+    """Пишет во временный файл рядом и подменяет path: читатель видит старый или новый файл целиком."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp создаёт файл с правами 0600 - сохраняем права подменяемого файла
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def _quiz_write_lock():
+    """Сериализует запись quiz.json между потоками и, где есть fcntl, между процессами."""
+    with _write_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(QUIZ_LOCK_PATH, "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def update_quiz_data(mutate) -> int:
+    """
+    Изменяет quiz.json под блокировкой записи и атомарно сохраняет новую версию.
+
+    Читателям блокировка не нужна: файл подменяется целиком через rename.
+
+    Args:
+        mutate: Функция, изменяющая словарь данных quiz.json на месте
+
+    Returns:
+        Номер новой версии
+    """
+    with _quiz_write_lock():
+        if QUIZ_JSON_PATH.exists():
+            with open(QUIZ_JSON_PATH, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        else:
+            data = {'test_names': {}, 'tests': {}}
+
+        mutate(data)
+
+        version = max(read_quiz_version(), int(data.get('version', 0))) + 1
+        data['version'] = version
+        _atomic_write(QUIZ_JSON_PATH, json.dumps(data, ensure_ascii=False, indent=2))
+        _atomic_write(QUIZ_VERSION_PATH, str(version))
+        return version
+
+
 def update_quiz_from_module(module_id: int = 1, module_name: str = None):
     """
     Обновляет quiz.json из Python модуля с тестами.
-    Для модуля 1 случайно выбирает одну из 3 версий вопросов.
+    Для модулей с версиями (tests_versions) сохраняет все версии и случайно
+    меняет версию по умолчанию; пользователь с user_id получает свою версию
+    независимо от неё (см. models/content.py).
     
     Args:
         module_id: ID модуля для обновления (по умолчанию 1)
@@ -47,13 +154,6 @@ def update_quiz_from_module(module_id: int = 1, module_name: str = None):
         module_name = "quiz_module"
     
     try:
-        # Загружаем текущие данные
-        if QUIZ_JSON_PATH.exists():
-            with open(QUIZ_JSON_PATH, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        else:
-            data = {'test_names': {}, 'tests': {}}
-        
         # Импортируем модуль
         import importlib
         module = importlib.import_module(module_name)
@@ -64,49 +164,43 @@ def update_quiz_from_module(module_id: int = 1, module_name: str = None):
         
         test_names = module.test_names
         tests_module = module.tests
-        
-        # Обновляем test_names
-        data['test_names'] = test_names
-        
-        # Для модуля 1 - работаем с версиями
-        if module_id == 1:
-            # Проверяем, есть ли уже структура с версиями
-            if str(module_id) in data['tests'] and isinstance(data['tests'][str(module_id)], dict) and 'versions' in data['tests'][str(module_id)]:
-                current_version = data['tests'][str(module_id)]['current_version']
-                # Выбираем случайную версию из двух других
-                other_versions = [v for v in [1, 2, 3] if v != current_version]
-                new_version = random.choice(other_versions)
-                data['tests'][str(module_id)]['current_version'] = new_version
-                print(f"🔄 Модуль {module_id}: версия {current_version} → версия {new_version}")
+
+        versions_data = getattr(module, 'tests_versions', {}).get(module_id)
+
+        def apply(data):
+            # Обновляем test_names
+            data['test_names'] = test_names
+            
+            key = str(module_id)
+            existing = data['tests'].get(key)
+            if isinstance(existing, dict) and 'versions' in existing:
+                current_version = existing['current_version']
+                versions = existing['versions']
             else:
-                # Первая инициализация - создаём структуру с версиями
-                # Проверяем, есть ли в модуле tests_versions
-                if hasattr(module, 'tests_versions') and module_id in module.tests_versions:
-                    versions_data = module.tests_versions[module_id]
-                    # Выбираем случайную версию для старта
-                    start_version = random.choice([1, 2, 3])
-                    data['tests'][str(module_id)] = {
-                        'current_version': start_version,
-                        'versions': {
-                            '1': versions_data[1],
-                            '2': versions_data[2],
-                            '3': versions_data[3]
-                        }
-                    }
-                    print(f"🆕 Модуль {module_id}: инициализирован с версией {start_version}")
+                current_version = None
+                versions = None
+
+            # Версии из модуля заменяют сохранённые (могли добавиться новые)
+            if versions_data:
+                versions = {str(n): questions for n, questions in versions_data.items()}
+
+            if versions:
+                # Версия по умолчанию (для запросов без user_id) - случайная из других
+                other_versions = [int(n) for n in versions if int(n) != current_version] or [int(n) for n in versions]
+                new_version = random.choice(other_versions)
+                data['tests'][key] = {'current_version': new_version, 'versions': versions}
+                if current_version is None:
+                    print(f"🆕 Модуль {module_id}: инициализирован с версией {new_version} из {len(versions)}")
                 else:
-                    # Если нет версий, используем обычную структуру
-                    data['tests'][str(module_id)] = tests_module[module_id]
-                    print(f"⚠️  Модуль {module_id}: версии не найдены, используется обычная структура")
-        else:
-            # Для остальных модулей - обычное обновление
-            data['tests'][str(module_id)] = tests_module[module_id]
+                    print(f"🔄 Модуль {module_id}: версия {current_version} → версия {new_version}")
+            else:
+                # Модуль без версий - обычное обновление
+                data['tests'][key] = tests_module[module_id]
         
         # Сохраняем в JSON
-        with open(QUIZ_JSON_PATH, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        version = update_quiz_data(apply)
         
-        print(f"✅ Данные обновлены из модуля {module_name} в {QUIZ_JSON_PATH}")
+        print(f"✅ Данные обновлены из модуля {module_name} в {QUIZ_JSON_PATH} (версия {version})")
         return True
         
     except ImportError as e:
@@ -116,4 +210,4 @@ def update_quiz_from_module(module_id: int = 1, module_name: str = None):
         print(f"❌ Ошибка при обновлении: {e}")
         import traceback
         traceback.print_exc()
-        return False
\ No newline at end of file
+        return False
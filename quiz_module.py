@@ -338,7 +338,9 @@ tests = {
     ]
 }
 
-# 🔹 3 версии вопросов для модуля 1 (История и миссия)
+# 🔹 Версии вопросов модулей: {номер модуля: {номер версии: вопросы}}.
+# Версии можно задать любому модулю, кроме калибровочного (0); каждый пользователь
+# стабильно получает одну из версий модуля. Сейчас - 3 версии модуля 1 (История и миссия)
 tests_versions = {
     1: {
         # Версия 1
@@ -24,6 +24,15 @@ try:
 except ImportError:
     TORCH_AVAILABLE = False
 
+try:
+    # Трассировка доступна, когда корень репозитория в sys.path (API и rag_api_server)
+    from models.tracing import span
+except ImportError:
+    from contextlib import nullcontext
+
+    def span(name, **attributes):
+        return nullcontext()
+
 
 class RAGAgent:
     """RAG агент для поиска релевантных чанков и ответов на вопросы."""
@@ -240,6 +249,82 @@ class RAGAgent:
         except Exception as e:
             raise RuntimeError(f"Ошибка при создании эмбеддинга: {e}")
     
+    def _get_query_embeddings(self, queries: List[str]) -> np.ndarray:
+        """
+        Создает эмбеддинги для нескольких запросов одним вызовом Ollama API.
+        
+        Args:
+            queries: Тексты запросов
+            
+        Returns:
+            Матрица эмбеддингов (по строке на запрос)
+        """
+        try:
+            response = requests.post(
+                f"{self.ollama_url}/api/embed",
+                json={
+                    "model": self.ollama_model,
+                    "input": queries
+                },
+                timeout=30
+            )
+        except requests.exceptions.RequestException as e:
+            raise RuntimeError(f"Ошибка при запросе к Ollama: {e}")
+        
+        # Старые версии Ollama не поддерживают /api/embed - считаем по одному
+        if response.status_code == 404:
+            return np.vstack([self._get_query_embedding(query) for query in queries])
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"Ошибка Ollama API: HTTP {response.status_code}, {response.text}")
+        
+        embeddings = response.json().get('embeddings', [])
+        if len(embeddings) != len(queries):
+            raise RuntimeError("Ollama вернул не все эмбеддинги")
+        
+        embeddings = np.array(embeddings, dtype=np.float32)
+        
+        # Нормализуем каждую строку (важно для FAISS)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return embeddings / norms
+    
+    def _search_embeddings(self, embeddings: np.ndarray, top_k: int) -> List[List[Dict]]:
+        """
+        Выполняет поиск в FAISS для матрицы эмбеддингов.
+        
+        Args:
+            embeddings: Матрица эмбеддингов запросов
+            top_k: Количество релевантных чанков на запрос
+            
+        Returns:
+            Для каждого запроса - список словарей с чанками и метаданными
+        """
+        if self.use_gpu_faiss:
+            # Используем GPU для поиска
+            res = faiss.StandardGpuResources()
+            index_gpu = faiss.index_cpu_to_gpu(res, 0, self.index)
+            distances, indices = index_gpu.search(embeddings, top_k)
+        else:
+            # Используем CPU для поиска
+            distances, indices = self.index.search(embeddings, top_k)
+        
+        # Формируем результаты
+        batch_results = []
+        for row_distances, row_indices in zip(distances, indices):
+            results = []
+            for i, (distance, idx) in enumerate(zip(row_distances, row_indices)):
+                # FAISS возвращает -1, если чанков меньше, чем top_k
+                if 0 <= idx < len(self.metadata):
+                    chunk_metadata = self.metadata[idx].copy()
+                    chunk_metadata['score'] = float(1 / (1 + distance))  # Конвертируем расстояние в score
+                    chunk_metadata['distance'] = float(distance)
+                    chunk_metadata['rank'] = i + 1
+                    results.append(chunk_metadata)
+            batch_results.append(results)
+        
+        return batch_results
+    
     def search(self, query: str, top_k: Optional[int] = None) -> List[Dict]:
         """
         Ищет релевантные чанки для запроса.
@@ -255,29 +340,36 @@ class RAGAgent:
             top_k = self.top_k
         
         # Создаем эмбеддинг для запроса
-        query_embedding = self._get_query_embedding(query)
+        with span("ollama.embed"):
+            query_embedding = self._get_query_embedding(query)
         
-        # Выполняем поиск
-        if self.use_gpu_faiss:
-            # Используем GPU для поиска
-            res = faiss.StandardGpuResources()
-            index_gpu = faiss.index_cpu_to_gpu(res, 0, self.index)
-            distances, indices = index_gpu.search(query_embedding, top_k)
-        else:
-            # Используем CPU для поиска
-            distances, indices = self.index.search(query_embedding, top_k)
+        with span("faiss.search", top_k=top_k):
+            return self._search_embeddings(query_embedding, top_k)[0]
+    
+    def search_batch(self, queries: List[str], top_k: Optional[int] = None) -> List[List[Dict]]:
+        """
+        Ищет релевантные чанки сразу для нескольких запросов.
         
-        # Формируем результаты
-        results = []
-        for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-            if idx < len(self.metadata):
-                chunk_metadata = self.metadata[idx].copy()
-                chunk_metadata['score'] = float(1 / (1 + distance))  # Конвертируем расстояние в score
-                chunk_metadata['distance'] = float(distance)
-                chunk_metadata['rank'] = i + 1
-                results.append(chunk_metadata)
-        
-        return results
+        Эмбеддинги считаются одним запросом к Ollama, поиск - одним вызовом FAISS.
+        
+        Args:
+            queries: Тексты запросов
+            top_k: Количество релевантных чанков (если None, используется self.top_k)
+            
+        Returns:
+            Для каждого запроса - список словарей с чанками и метаданными
+        """
+        if top_k is None:
+            top_k = self.top_k
+        
+        if not queries:
+            return []
+        
+        with span("ollama.embed", size=len(queries)):
+            embeddings = self._get_query_embeddings(queries)
+        
+        with span("faiss.search", top_k=top_k, size=len(queries)):
+            return self._search_embeddings(embeddings, top_k)
     
     def answer(self, query: str, top_k: Optional[int] = None, max_context_length: int = 2000) -> Dict:
         """
@@ -294,6 +386,21 @@ class RAGAgent:
         # Ищем релевантные чанки
         relevant_chunks = self.search(query, top_k)
         
+        with span("context.build"):
+            return self.build_answer(query, relevant_chunks, max_context_length)
+    
+    def build_answer(self, query: str, relevant_chunks: List[Dict], max_context_length: int = 2000) -> Dict:
+        """
+        Собирает контекст и список источников из найденных чанков.
+        
+        Args:
+            query: Текст вопроса
+            relevant_chunks: Чанки, найденные search/search_batch
+            max_context_length: Максимальная длина контекста в символах
+            
+        Returns:
+            Словарь с ответом и релевантными чанками
+        """
         # Формируем контекст из релевантных чанков
         context_parts = []
         current_length = 0
@@ -8,7 +8,7 @@ import io
 import os
 from pathlib import Path
 from typing import List, Dict, Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 import uvicorn
@@ -18,7 +18,13 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
+# Корень репозитория - для общих модулей (models/tracing.py, models/profiler.py)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("TRACE_SERVICE", "rag-api")
+
 from rag_agent import RAGAgent
+from models.tracing import span, TRACEPARENT_HEADER
+from models.profiler import profiler_router
 
 # Инициализация FastAPI приложения
 app = FastAPI(
@@ -27,6 +33,8 @@ app = FastAPI(
     version="1.0.0"
 )
 
+app.include_router(profiler_router)
+
 # Настройка CORS для разрешения запросов с других доменов
 app.add_middleware(
     CORSMiddleware,
@@ -36,6 +44,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def tracing_middleware(request: Request, call_next):
+    """Продолжает трассу из заголовка traceparent вызывающего сервиса."""
+    with span(
+        f"{request.method} {request.url.path}",
+        traceparent=request.headers.get(TRACEPARENT_HEADER)
+    ) as current:
+        response = await call_next(request)
+        current.set(status=response.status_code)
+        response.headers["X-Trace-Id"] = current.trace_id
+        return response
+
+
 # Глобальный экземпляр RAG агента
 rag_agent: Optional[RAGAgent] = None
 
@@ -97,6 +118,16 @@ class AnswerResponse(BaseModel):
     relevant_chunks: List[ChunkResponse]
 
 
+class BatchAnswerRequest(BaseModel):
+    """Модель пакетного запроса контекста (несколько вопросов за один вызов)."""
+    requests: List[AnswerRequest] = Field(..., description="Запросы контекста", min_length=1, max_length=64)
+
+
+class BatchAnswerResponse(BaseModel):
+    """Модель ответа на пакетный запрос, порядок совпадает с запросом."""
+    results: List[AnswerResponse]
+
+
 class HealthResponse(BaseModel):
     """Модель ответа для проверки здоровья сервиса."""
     status: str
@@ -147,6 +178,7 @@ async def root():
             "/health": "Проверка здоровья сервиса",
             "/search": "Поиск релевантных чанков (POST)",
             "/answer": "Получение ответа с контекстом (POST)",
+            "/answer_batch": "Пакетное получение контекста (POST)",
             "/docs": "Интерактивная документация API"
         }
     }
@@ -229,6 +261,55 @@ async def search(request: SearchRequest):
         raise HTTPException(status_code=500, detail=f"Ошибка при поиске: {str(e)}")
 
 
+def _chunk_to_response(rank: int, chunk: Dict) -> ChunkResponse:
+    """Преобразует чанк агента в модель ответа."""
+    return ChunkResponse(
+        rank=rank,
+        score=chunk.get('score', 0.0),
+        distance=chunk.get('distance', 0.0),
+        document_name=chunk.get('document_name'),
+        document_short_name=chunk.get('document_short_name'),
+        document_source=chunk.get('document_source'),
+        document_number=chunk.get('document_number'),
+        document_date=chunk.get('document_date'),
+        paragraph_name=chunk.get('paragraph_name'),
+        paragraph_number=chunk.get('paragraph_number'),
+        page_number=chunk.get('page_number'),
+        text=chunk.get('text', ''),
+        text_length=len(chunk.get('text', ''))
+    )
+
+
+def _answer_to_response(answer_data: Dict) -> AnswerResponse:
+    """Преобразует ответ агента в модель ответа."""
+    # Преобразуем источники
+    sources = []
+    for source in answer_data.get('sources', []):
+        source_resp = SourceResponse(
+            document_name=source.get('document_name'),
+            document_short_name=source.get('document_short_name'),
+            document_source=source.get('document_source'),
+            document_number=source.get('document_number'),
+            document_date=source.get('document_date')
+        )
+        sources.append(source_resp)
+    
+    # Преобразуем релевантные чанки
+    relevant_chunks = [
+        _chunk_to_response(i, chunk)
+        for i, chunk in enumerate(answer_data.get('relevant_chunks', []), 1)
+    ]
+    
+    return AnswerResponse(
+        query=answer_data.get('query', ''),
+        context=answer_data.get('context', ''),
+        context_length=answer_data.get('context_length', 0),
+        num_chunks_used=answer_data.get('num_chunks_used', 0),
+        sources=sources,
+        relevant_chunks=relevant_chunks
+    )
+
+
 @app.post("/answer", response_model=AnswerResponse, tags=["Ответы"])
 async def answer(request: AnswerRequest):
     """
@@ -256,49 +337,61 @@ async def answer(request: AnswerRequest):
             max_context_length=request.max_context_length
         )
         
-        # Преобразуем источники
-        sources = []
-        for source in answer_data.get('sources', []):
-            source_resp = SourceResponse(
-                document_name=source.get('document_name'),
-                document_short_name=source.get('document_short_name'),
-                document_source=source.get('document_source'),
-                document_number=source.get('document_number'),
-                document_date=source.get('document_date')
-            )
-            sources.append(source_resp)
+        return _answer_to_response(answer_data)
         
-        # Преобразуем релевантные чанки
-        relevant_chunks = []
-        for i, chunk in enumerate(answer_data.get('relevant_chunks', []), 1):
-            chunk_resp = ChunkResponse(
-                rank=i,
-                score=chunk.get('score', 0.0),
-                distance=chunk.get('distance', 0.0),
-                document_name=chunk.get('document_name'),
-                document_short_name=chunk.get('document_short_name'),
-                document_source=chunk.get('document_source'),
-                document_number=chunk.get('document_number'),
-                document_date=chunk.get('document_date'),
-                paragraph_name=chunk.get('paragraph_name'),
-                paragraph_number=chunk.get('paragraph_number'),
-                page_number=chunk.get('page_number'),
-                text=chunk.get('text', ''),
-                text_length=len(chunk.get('text', ''))
-            )
-            relevant_chunks.append(chunk_resp)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении ответа: {str(e)}")
+
+
+@app.post("/answer_batch", response_model=BatchAnswerResponse, tags=["Ответы"])
+def answer_batch(request: BatchAnswerRequest):
+    """
+    Пакетное получение контекста для нескольких вопросов.
+    
+    Эмбеддинги всех вопросов считаются одним запросом к Ollama, поиск -
+    одним вызовом FAISS. Используется клиентом models/rag_client.py,
+    который собирает одновременные запросы в пакет.
+    
+    Обычная (не async) функция: поиск блокирующий (requests к Ollama и
+    FAISS), поэтому FastAPI выполняет её в пуле потоков, не останавливая
+    остальные запросы к серверу.
+    
+    Пример запроса:
+    ```json
+    {
+        "requests": [
+            {"query": "Какие требования к газоопасным работам?", "top_k": 5},
+            {"query": "Как оформить наряд-допуск?", "top_k": 3}
+        ]
+    }
+    ```
+    """
+    global rag_agent
+    
+    if rag_agent is None:
+        raise HTTPException(status_code=503, detail="RAG агент не инициализирован")
+    
+    try:
+        queries = [item.query for item in request.requests]
+        max_top_k = max(item.top_k for item in request.requests)
         
-        return AnswerResponse(
-            query=request.query,
-            context=answer_data.get('context', ''),
-            context_length=answer_data.get('context_length', 0),
-            num_chunks_used=answer_data.get('num_chunks_used', 0),
-            sources=sources,
-            relevant_chunks=relevant_chunks
-        )
+        # Ищем один раз с максимальным top_k, затем обрезаем под каждый запрос
+        chunks_batch = rag_agent.search_batch(queries, top_k=max_top_k)
+        
+        results = []
+        with span("context.build", size=len(request.requests)):
+            for item, chunks in zip(request.requests, chunks_batch):
+                answer_data = rag_agent.build_answer(
+                    item.query,
+                    chunks[:item.top_k],
+                    max_context_length=item.max_context_length
+                )
+                results.append(_answer_to_response(answer_data))
+        
+        return BatchAnswerResponse(results=results)
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка при получении ответа: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении ответов: {str(e)}")
 
 
 if __name__ == "__main__":